@@ -0,0 +1,454 @@
+# Офлайн-бенчмарк bot.py: локальные заглушки Telegram Bot API и ok.ru.
+#
+# Запуск (нужны Chrome и зависимости из requirements.txt):
+#   python benchmark.py --groups 10 --concurrency 2 --video-mb 5
+#
+# Бот запускается целиком через bot.main() против заглушек, в конце
+# печатается отчёт: групп в минуту, время до первого поста, число вызовов
+# WebDriver (всего, на группу и по командам) и длительность фаз из трейса бота.
+import os
+import sys
+import re
+import json
+import time
+import hashlib
+import argparse
+import tempfile
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+TOKEN = "123456:BENCH"
+CHAT_ID = 1
+EMAIL = "bench@example.com"
+PASSWORD = "bench-password"
+
+# Сессия заглушки ok.ru не хранится в памяти, чтобы повторный запуск
+# с тем же --state-dir мог восстановить сохранённую сессию бота
+SESSION_ID = hashlib.sha256(f"{EMAIL}:{PASSWORD}".encode()).hexdigest()[:32]
+
+LOGIN_PAGE = """<!DOCTYPE html><html><head><meta charset="utf-8"><title>OK</title></head>
+<body data-l="anonymMain">
+<form method="post" action="/login">
+  <input name="st.email" type="text">
+  <input name="st.password" type="password">
+  <input type="submit" value="Log in">
+</form>
+</body></html>"""
+
+CONFIRM_PAGE = """<!DOCTYPE html><html><head><meta charset="utf-8"><title>OK</title></head>
+<body data-l="anonymMain">
+<form method="post" action="/confirm"><input type="submit" value="Yes, confirm"></form>
+</body></html>"""
+
+HOME_PAGE = """<!DOCTYPE html><html><head><meta charset="utf-8"><title>OK</title></head>
+<body data-l="userMain"><h1>Лента</h1></body></html>"""
+
+POST_PAGE = """<!DOCTYPE html><html><head><meta charset="utf-8"><title>OK</title>
+<style>#video-dialog, #my-videos { display: none; } .toast { position: fixed; top: 10px; right: 10px; }</style>
+</head>
+<body data-l="userMain">
+<div class="posting-form">
+  <div contenteditable="true" class="posting_itx" style="min-height: 40px; border: 1px solid #ccc"></div>
+  <div data-l="t,button.video"><span class="posting_ac_i">Видео</span></div>
+  <div id="video-dialog">
+    <a href="#" class="js-my-videos">Мои видео</a>
+    <div id="my-videos">__MY_VIDEOS__</div>
+    <input type="file" class="js-fileapi-input video-upload-input" accept="video/*">
+    <div class="upload-progress"><div class="progress-bar" role="progressbar" aria-valuenow="0" style="width: 0%"></div></div>
+  </div>
+  <div id="attached"></div>
+  <button class="js-pf-submit-btn" data-action="submit" disabled>Поделиться</button>
+</div>
+<div id="tips"></div>
+<script>
+const CFG = __CONFIG__;
+const $ = (s) => document.querySelector(s);
+const share = $("button.js-pf-submit-btn");
+
+$("div[data-l='t,button.video'] .posting_ac_i").addEventListener('click', () => {
+  setTimeout(() => { $("#video-dialog").style.display = 'block'; }, CFG.dialog_delay_ms);
+});
+$(".js-my-videos").addEventListener('click', (e) => {
+  e.preventDefault();
+  $("#my-videos").style.display = 'block';
+});
+document.querySelectorAll("#my-videos [data-id]").forEach((el) => {
+  el.addEventListener('click', () => attach(el.dataset.id, CFG.attach_delay_ms));
+});
+
+function attach(id, delay) {
+  $("#video-dialog").style.display = 'none';
+  $("#attached").innerHTML = '<div class="attached-video" data-movie-id="' + id + '">video ' + id + '</div>';
+  setTimeout(() => { share.disabled = false; }, delay);
+}
+
+$("input.video-upload-input").addEventListener('change', (e) => {
+  const file = e.target.files[0];
+  const total = Math.max(0.2, file.size / CFG.upload_bps) * 1000;
+  const started = Date.now();
+  const bar = $(".progress-bar");
+  const timer = setInterval(() => {
+    const pct = Math.min(100, Math.round((Date.now() - started) / total * 100));
+    bar.setAttribute('aria-valuenow', pct);
+    bar.style.width = pct + '%';
+    if (pct >= 100) {
+      clearInterval(timer);
+      fetch('/dk?cmd=VideoUploaded', {method: 'POST'})
+        .then((r) => r.json())
+        .then((d) => attach(d.id, CFG.share_delay_ms));
+    }
+  }, 250);
+});
+
+share.addEventListener('click', () => {
+  if (share.disabled) return;
+  share.disabled = true;
+  fetch('/dk?cmd=MediaTopicPost&gid=' + CFG.group_id, {method: 'POST'})
+    .then((r) => r.json())
+    .then((d) => {
+      $("#tips").innerHTML = '<div class="toast"><a href="' + d.topic + '">Пост опубликован</a></div>';
+      setTimeout(() => { $("#tips").innerHTML = ''; }, CFG.toast_ms);
+    });
+});
+</script>
+</body></html>"""
+
+
+class QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, body, status=200, content_type="text/html; charset=utf-8", headers=None):
+        if isinstance(body, str):
+            body = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, payload, status=200):
+        self.send_body(json.dumps(payload, ensure_ascii=False), status, "application/json")
+
+    def redirect(self, location, cookie=None):
+        headers = {"Location": location}
+        if cookie:
+            headers["Set-Cookie"] = cookie
+        self.send_body("", 302, headers=headers)
+
+    def read_form(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length).decode() if length else ""
+        return {k: v[0] for k, v in parse_qs(raw).items()}
+
+
+# Заглушка Telegram Bot API: getUpdates (long polling), getFile, скачивание файла, sendMessage
+class MockTelegram:
+    def __init__(self, group_urls, video_bytes, command_delay, local_path=None):
+        self.video_bytes = video_bytes
+        self.local_path = local_path  # как у telegram-bot-api --local: getFile отдаёт путь на диске
+        self.started = time.time()
+        self.command_delay = command_delay
+        self.messages = []
+        self.calls = Counter()
+        self._cond = threading.Condition()
+        video = {
+            "file_id": "bench-video",
+            "file_unique_id": "bench-unique-" + hashlib.sha256(video_bytes).hexdigest()[:12],
+            "file_size": len(video_bytes),
+            "mime_type": "video/mp4"
+        }
+        chat = {"id": CHAT_ID}
+        self.updates = [
+            {"update_id": 1, "message": {"message_id": 1, "chat": chat, "text": "#группы " + " ".join(group_urls)}},
+            {"update_id": 2, "message": {"message_id": 2, "chat": chat, "caption": "#пост Бенчмарк", "video": video}}
+        ]
+
+    def released(self, offset):
+        if time.time() - self.started < self.command_delay:
+            return []
+        return [u for u in self.updates if offset is None or u["update_id"] >= offset]
+
+    def handler(self):
+        mock = self
+
+        class Handler(QuietHandler):
+            def do_GET(self):
+                self.route(parse_qs(urlparse(self.path).query))
+
+            def do_POST(self):
+                params = parse_qs(urlparse(self.path).query)
+                params.update({k: [v] for k, v in self.read_form().items()})
+                self.route(params)
+
+            def route(self, params):
+                path = urlparse(self.path).path
+                arg = lambda name, default=None: params.get(name, [default])[0]
+
+                if path.startswith(f"/file/bot{TOKEN}/"):
+                    mock.calls["download"] += 1
+                    return self.send_file()
+
+                method = path.rsplit("/", 1)[-1]
+                mock.calls[method] += 1
+                if method == "getUpdates":
+                    offset = arg("offset")
+                    offset = int(offset) if offset is not None else None
+                    if offset == -1:
+                        return self.send_json({"ok": True, "result": []})
+                    deadline = time.time() + min(float(arg("timeout", 0)), 30)
+                    with mock._cond:
+                        result = mock.released(offset)
+                        while not result and time.time() < deadline:
+                            mock._cond.wait(min(0.2, max(0.0, deadline - time.time())))
+                            result = mock.released(offset)
+                    return self.send_json({"ok": True, "result": result})
+                if method == "getFile":
+                    return self.send_json({"ok": True, "result": {
+                        "file_id": arg("file_id"),
+                        "file_unique_id": mock.updates[1]["message"]["video"]["file_unique_id"],
+                        "file_size": len(mock.video_bytes),
+                        "file_path": mock.local_path or "videos/bench.mp4"
+                    }})
+                if method == "sendMessage":
+                    mock.messages.append(arg("text", ""))
+                    return self.send_json({"ok": True, "result": {"message_id": len(mock.messages)}})
+                self.send_json({"ok": False, "error_code": 404, "description": "Not Found"}, 404)
+
+            def send_file(self):
+                data = mock.video_bytes
+                m = re.match(r"bytes=(\d+)-", self.headers.get("Range") or "")
+                if m:
+                    start = int(m.group(1))
+                    return self.send_body(data[start:], 206, "video/mp4", {
+                        "Content-Range": f"bytes {start}-{len(data) - 1}/{len(data)}"
+                    })
+                self.send_body(data, 200, "video/mp4")
+
+        return Handler
+
+
+# Заглушка ok.ru: вход, подтверждение личности, страница постинга с загрузкой видео
+class MockOk:
+    def __init__(self, args):
+        self.args = args
+        self.calls = Counter()
+        self.videos = []
+        self.topics = Counter()
+        self._lock = threading.Lock()
+
+    def config(self, group_id):
+        a = self.args
+        return {
+            "group_id": group_id,
+            "upload_bps": a.upload_kbps * 1024,
+            "share_delay_ms": int(a.share_delay * 1000),
+            "attach_delay_ms": int(a.attach_delay * 1000),
+            "dialog_delay_ms": int(a.dialog_delay * 1000),
+            "toast_ms": int(a.toast_seconds * 1000)
+        }
+
+    def handler(self):
+        mock = self
+
+        class Handler(QuietHandler):
+            def logged_in(self):
+                return f"mock_sid={SESSION_ID}" in (self.headers.get("Cookie") or "")
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                mock.calls["GET " + re.sub(r"\d+", "<id>", path)] += 1
+                time.sleep(mock.args.page_latency)
+                if path == "/":
+                    return self.send_body(HOME_PAGE if self.logged_in() else LOGIN_PAGE)
+                if path == "/confirm":
+                    return self.send_body(CONFIRM_PAGE)
+                m = re.match(r"^/group/(\d+)/post/?$", path)
+                if m:
+                    if not self.logged_in():
+                        return self.redirect("/")
+                    with mock._lock:
+                        my_videos = "".join(f'<div data-id="{v}">video {v}</div>' for v in mock.videos)
+                    page = POST_PAGE.replace("__CONFIG__", json.dumps(mock.config(m.group(1))))
+                    return self.send_body(page.replace("__MY_VIDEOS__", my_videos))
+                self.send_body("Not Found", 404, "text/plain")
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                form = self.read_form()
+                mock.calls["POST " + url.path + "?" + query.get("cmd", [""])[0]] += 1
+
+                if url.path == "/login":
+                    ok = form.get("st.email") == EMAIL and form.get("st.password") == PASSWORD
+                    return self.redirect("/confirm" if ok else "/")
+                if url.path == "/confirm":
+                    return self.redirect("/", cookie=f"mock_sid={SESSION_ID}; Path=/")
+                if url.path == "/dk" and query.get("cmd") == ["VideoUploaded"]:
+                    with mock._lock:
+                        video_id = str(9000 + len(mock.videos))
+                        mock.videos.append(video_id)
+                    return self.send_json({"ok": True, "id": video_id})
+                if url.path == "/dk" and query.get("cmd") == ["MediaTopicPost"]:
+                    time.sleep(mock.args.publish_latency)
+                    group_id = query.get("gid", ["0"])[0]
+                    with mock._lock:
+                        mock.topics[group_id] += 1
+                        topic_id = 150000000 + sum(mock.topics.values())
+                    return self.send_json({"ok": True, "topic": f"/group/{group_id}/topic/{topic_id}"})
+                self.send_body("Not Found", 404, "text/plain")
+
+        return Handler
+
+
+def serve(handler):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-server", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+# Счётчик команд WebDriver: каждая команда - отдельный HTTP-запрос к chromedriver
+def count_webdriver_calls():
+    from selenium.webdriver.remote.webdriver import WebDriver
+
+    calls = Counter()
+    original = WebDriver.execute
+
+    def execute(self, driver_command, params=None):
+        calls[driver_command] += 1
+        return original(self, driver_command, params)
+
+    WebDriver.execute = execute
+    return calls
+
+
+def report(bot, webdriver_calls, telegram, ok, args):
+    spans, phases = bot.tracer.summary()
+    posts = [sp for sp in spans if sp["name"] == "post_to_group"]
+    posted = [sp for sp in posts if sp["attrs"].get("link")]
+
+    result = {
+        "groups": args.groups,
+        "concurrency": args.concurrency,
+        "video_mb": args.video_mb,
+        "posted": len(posted),
+        "failed": len(posts) - len(posted),
+        "time_to_first_post": None,
+        "groups_per_minute": None,
+        "webdriver_calls": sum(webdriver_calls.values()),
+        "webdriver_calls_per_group": None,
+        "webdriver_commands": dict(webdriver_calls.most_common(10)),
+        "telegram_calls": dict(telegram.calls),
+        "telegram_messages": len(telegram.messages),
+        "ok_requests": dict(ok.calls),
+        "phases": {name: {"count": ph["count"], "sum": round(ph["sum"], 3), "max": round(ph["max"], 3)}
+                   for name, ph in phases.items()}
+    }
+    if posted:
+        result["time_to_first_post"] = round(min(sp["start"] + sp["duration"] for sp in posted), 2)
+        window = max(sp["start"] + sp["duration"] for sp in posts) - min(sp["start"] for sp in posts)
+        result["groups_per_minute"] = round(len(posted) / max(window, 0.001) * 60, 2)
+    if posts:
+        result["webdriver_calls_per_group"] = round(result["webdriver_calls"] / len(posts), 1)
+
+    print("\n=== Результаты бенчмарка ===")
+    print(f"Опубликовано: {result['posted']}/{args.groups} (ошибок {result['failed']})")
+    print(f"Время до первого поста: {result['time_to_first_post']} сек")
+    print(f"Групп в минуту: {result['groups_per_minute']}")
+    print(f"Вызовов WebDriver: {result['webdriver_calls']} (на группу {result['webdriver_calls_per_group']})")
+    for command, count in webdriver_calls.most_common(10):
+        print(f"  {command}: {count}")
+    print(f"Запросов к Bot API: {sum(telegram.calls.values())}, сообщений отправлено: {len(telegram.messages)}")
+    print("Фазы (сумма / количество / максимум, сек):")
+    for name, ph in sorted(result["phases"].items(), key=lambda kv: -kv[1]["sum"]):
+        print(f"  {name}: {ph['sum']} / {ph['count']} / {ph['max']}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк bot.py с заглушками ok.ru и Telegram")
+    parser.add_argument("--groups", type=int, default=5, help="число групп в команде #группы")
+    parser.add_argument("--concurrency", type=int, default=1, help="POST_CONCURRENCY для бота")
+    parser.add_argument("--video-mb", type=float, default=5, help="размер тестового видео, МБ")
+    parser.add_argument("--upload-kbps", type=float, default=4096, help="имитируемая скорость загрузки, КБ/с")
+    parser.add_argument("--share-delay", type=float, default=2, help="обработка видео после загрузки, сек")
+    parser.add_argument("--attach-delay", type=float, default=0.5, help="прикрепление из «Мои видео», сек")
+    parser.add_argument("--dialog-delay", type=float, default=0.3, help="появление окна видео, сек")
+    parser.add_argument("--publish-latency", type=float, default=0.5, help="ответ сервера на публикацию, сек")
+    parser.add_argument("--page-latency", type=float, default=0.2, help="задержка отдачи страниц, сек")
+    parser.add_argument("--toast-seconds", type=float, default=5, help="сколько висит уведомление о посте, сек")
+    parser.add_argument("--command-delay", type=float, default=0, help="через сколько сек приходят команды")
+    parser.add_argument("--min-interval", type=float, default=0, help="POST_MIN_INTERVAL для бота")
+    parser.add_argument("--local-api", action="store_true", help="имитировать локальный сервер Bot API")
+    parser.add_argument("--state-dir", help="каталог для сессии и кэшей (повторный запуск = тёплый старт)")
+    parser.add_argument("--json", help="сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    state_dir = args.state_dir or tempfile.mkdtemp(prefix="okru_bench_")
+    os.makedirs(state_dir, exist_ok=True)
+
+    ok = MockOk(args)
+    ok_server, ok_url = serve(ok.handler())
+    group_urls = [f"{ok_url}/group/{1000 + i}/" for i in range(args.groups)]
+    video_bytes = os.urandom(int(args.video_mb * 1024 * 1024))
+    local_path = None
+    if args.local_api:
+        local_path = os.path.join(state_dir, "bot-api", "videos", "bench.mp4")
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        with open(local_path, "wb") as f:
+            f.write(video_bytes)
+    telegram = MockTelegram(group_urls, video_bytes, args.command_delay, local_path)
+    tg_server, tg_url = serve(telegram.handler())
+
+    os.environ.update({
+        "OK_EMAIL": EMAIL,
+        "OK_PASSWORD": PASSWORD,
+        "TELEGRAM_BOT_TOKEN": TOKEN,
+        "TELEGRAM_USER_ID": str(CHAT_ID),
+        "OK_BASE_URL": ok_url,
+        "TELEGRAM_API_URL": tg_url,
+        "TELEGRAM_POLL_TIMEOUT": "5",
+        "POST_CONCURRENCY": str(args.concurrency),
+        "POST_MIN_INTERVAL": str(args.min_interval),
+        "TEMP_VIDEO_DIR": os.path.join(state_dir, "videos"),
+        "VIDEO_CACHE_DIR": os.path.join(state_dir, "video_cache"),
+        "SESSION_FILE": os.path.join(state_dir, "session.bin"),
+        "SELECTOR_CACHE_FILE": os.path.join(state_dir, "selectors.json"),
+        "UPLOAD_STATS_FILE": os.path.join(state_dir, "upload_stats.json"),
+        "TRACE_FILE": os.path.join(state_dir, "trace.json"),
+        "ARTIFACT_DIR": os.path.join(state_dir, "artifacts"),
+        "JOURNAL_FILE": os.path.join(state_dir, "journal.json"),
+        "RESUME_RUN": "0",  # каждый прогон публикует во все группы заново
+        "TELEGRAM_LOCAL_API": "1" if args.local_api else "0",
+        "METRICS_FILE": os.path.join(state_dir, "bot_metrics.prom")
+    })
+
+    webdriver_calls = count_webdriver_calls()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import bot
+
+    try:
+        bot.main()
+    except SystemExit as e:
+        print(f"⚠️ bot.main() завершился с кодом {e.code}")
+    finally:
+        ok_server.shutdown()
+        tg_server.shutdown()
+
+    report(bot, webdriver_calls, telegram, ok, args)
+    print(f"Каталог состояния: {state_dir}")
+
+
+if __name__ == "__main__":
+    main()
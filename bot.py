@@ -2,15 +2,32 @@ import os
 import time
 import re
 import requests
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
 import logging
 import sys
 import tempfile
+import shutil
+import subprocess
+import json
+import hashlib
+import gzip
+import base64
+import queue
+import threading
+import sqlite3
+import signal
+import multiprocessing
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 import undetected_chromedriver as uc
+from cryptography.fernet import Fernet, InvalidToken
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException
+from selenium.common.exceptions import TimeoutException, WebDriverException
 
 # Чтение учётных данных из окружения
 EMAIL = os.environ.get("OK_EMAIL")
@@ -18,46 +35,450 @@ PASSWORD = os.environ.get("OK_PASSWORD")
 TELEGRAM_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
 TELEGRAM_USER_ID = os.environ.get("TELEGRAM_USER_ID")
 
+# Адреса сервисов (переопределяются для локальных стендов и бенчмарка)
+OK_BASE_URL = os.getenv("OK_BASE_URL", "https://ok.ru").rstrip('/')
+OK_HOST = urlparse(OK_BASE_URL).netloc
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+# Собственный сервер Bot API (telegram-bot-api --local): getFile отдаёт абсолютный
+# путь к файлу на диске, и видео берётся прямо оттуда без скачивания и копирования.
+# Лимит облачного API на getFile — 20 МБ, локальный сервер отдаёт файлы до 2000 МБ.
+TELEGRAM_LOCAL_API = os.getenv("TELEGRAM_LOCAL_API", "0") == "1"
+MAX_VIDEO_MB = int(os.getenv("MAX_VIDEO_MB", "2000" if TELEGRAM_LOCAL_API else "20"))
+
+# Несколько аккаунтов ok.ru для параллельного постинга: "email:пароль"
+# через перевод строки или ";"
+OK_ACCOUNTS = [
+    {'email': email.strip(), 'password': password.strip()}
+    for email, _, password in (item.partition(':') for item in re.split(r"[;\n]", os.environ.get("OK_ACCOUNTS", "")))
+    if email.strip() and password.strip()
+]
+if OK_ACCOUNTS and not EMAIL:
+    EMAIL, PASSWORD = OK_ACCOUNTS[0]['email'], OK_ACCOUNTS[0]['password']
+
 if not all([EMAIL, PASSWORD, TELEGRAM_TOKEN, TELEGRAM_USER_ID]):
-    print("❌ Задайте OK_EMAIL, OK_PASSWORD, TELEGRAM_BOT_TOKEN и TELEGRAM_USER_ID.")
+    print("❌ Задайте OK_EMAIL, OK_PASSWORD (или OK_ACCOUNTS), TELEGRAM_BOT_TOKEN и TELEGRAM_USER_ID.")
     sys.exit(1)
 
+# Общий клиент Telegram Bot API: keep-alive пул соединений, таймауты,
+# повторы при временных ошибках и разбор JSON в одном месте
+class BotApi:
+    def __init__(self, token, base_url="https://api.telegram.org", timeout=15, retries=3, pool_size=10):
+        self.token = token
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.retries = retries
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def method_url(self, method):
+        return f"{self.base_url}/bot{self.token}/{method}"
+
+    def file_url(self, file_path):
+        return f"{self.base_url}/file/bot{self.token}/{file_path}"
+
+    def call(self, method, params=None, data=None, timeout=None, retries=None):
+        retries = retries or self.retries
+        timeout = timeout or self.timeout
+        result = None
+        for attempt in range(retries):
+            last_attempt = attempt == retries - 1
+            try:
+                resp = self.session.request(
+                    "POST" if data is not None else "GET",
+                    self.method_url(method),
+                    params=params, data=data, timeout=timeout
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                if last_attempt:
+                    raise
+                time.sleep(min(2 ** attempt, 10))
+                continue
+
+            try:
+                result = resp.json()
+            except ValueError:
+                result = {'ok': False, 'error_code': resp.status_code, 'description': resp.text}
+
+            if resp.status_code == 429 and not last_attempt:
+                # Telegram сообщает, сколько секунд нужно подождать
+                time.sleep(result.get('parameters', {}).get('retry_after', 2 ** attempt))
+                continue
+            if resp.status_code >= 500 and not last_attempt:
+                time.sleep(min(2 ** attempt, 10))
+                continue
+            return result
+        return result
+
+    def download(self, file_path, timeout=60, **kwargs):
+        return self.session.get(self.file_url(file_path), timeout=timeout, **kwargs)
+
+bot_api = BotApi(TELEGRAM_TOKEN, base_url=TELEGRAM_API_URL)
+
+# Отправка сообщений в Telegram пачками из фонового потока: строки складываются
+# в очередь и склеиваются в как можно меньшее число сообщений до 4096 символов,
+# чтобы автоматизация браузера не ждала сетевых запросов к Telegram.
+class MessageBatcher:
+    MAX_MESSAGE_LEN = 4096
+
+    def __init__(self, api, chat_id, flush_interval=2.0, max_attempts=5, name="telegram-batcher"):
+        self.api = api
+        self.chat_id = chat_id
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.queue = queue.Queue()
+        self._closing = threading.Event()
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    def put(self, text):
+        self.queue.put_nowait(text)
+
+    def close(self):
+        # Дожидаемся отправки всего, что осталось в очереди
+        if not self._closing.is_set():
+            self._closing.set()
+            self.queue.put(None)
+            self._worker.join(timeout=30)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                first = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            lines = []
+            if first is None:
+                stopping = True
+            else:
+                lines.append(first)
+                # Даём записям накопиться, чтобы отправить их одним сообщением
+                self._closing.wait(self.flush_interval)
+
+            while True:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                else:
+                    lines.append(item)
+
+            for chunk in self._pack(lines):
+                self._send(chunk)
+
+    def _pack(self, lines):
+        chunks = []
+        current = ""
+        for line in lines:
+            # Слишком длинную запись режем на части
+            while len(line) > self.MAX_MESSAGE_LEN:
+                if current:
+                    chunks.append(current)
+                    current = ""
+                chunks.append(line[:self.MAX_MESSAGE_LEN])
+                line = line[self.MAX_MESSAGE_LEN:]
+            if not line:
+                continue
+            if current and len(current) + 1 + len(line) > self.MAX_MESSAGE_LEN:
+                chunks.append(current)
+                current = line
+            else:
+                current = f"{current}\n{line}" if current else line
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def _send(self, text):
+        try:
+            self.api.call("sendMessage", data={
+                "chat_id": self.chat_id,
+                "text": text
+            }, retries=self.max_attempts)
+        except:
+            pass
+
 # Логгер: консоль + Telegram
 class TelegramHandler(logging.Handler):
-    def __init__(self, token, chat_id):
+    def __init__(self, api, chat_id, flush_interval=2.0, max_attempts=5):
         super().__init__()
-        self.api_url = f"https://api.telegram.org/bot{token}/sendMessage"
-        self.chat_id = chat_id
+        self.batcher = MessageBatcher(api, chat_id, flush_interval, max_attempts, name="telegram-log")
 
     def emit(self, record):
         try:
-            requests.post(self.api_url, data={
-                "chat_id": self.chat_id,
-                "text": self.format(record)
-            })
+            self.batcher.put(self.format(record))
         except:
             pass
 
+    def close(self):
+        self.batcher.close()
+        super().close()
+
 logger = logging.getLogger("okru_bot")
 logger.setLevel(logging.INFO)
 fmt = logging.Formatter("%(asctime)s | %(levelname)s | %(message)s")
 ch = logging.StreamHandler(sys.stdout)
 ch.setFormatter(fmt)
 logger.addHandler(ch)
-tg = TelegramHandler(TELEGRAM_TOKEN, TELEGRAM_USER_ID)
+tg = TelegramHandler(
+    bot_api, TELEGRAM_USER_ID,
+    flush_interval=float(os.getenv("TELEGRAM_LOG_FLUSH_INTERVAL", "2"))
+)
 tg.setFormatter(fmt)
 logger.addHandler(tg)
 
-# Инициализация WebDriver
-def init_driver():
+# Замеры длительности фаз работы (span'ы с атрибутами).
+# В конце запуска пишутся JSON-трейс и textfile для Prometheus node_exporter.
+class Tracer:
+    def __init__(self, max_spans=None):
+        self.started = time.time()
+        self.spans = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **attrs):
+        record = {
+            'name': name,
+            'start': round(time.time() - self.started, 3),
+            'thread': threading.current_thread().name,
+            'attrs': attrs,
+            'status': 'ok'
+        }
+        started = time.perf_counter()
+        try:
+            yield attrs
+        except BaseException as e:
+            record['status'] = 'error'
+            record['error'] = str(e)
+            raise
+        finally:
+            record['duration'] = round(time.perf_counter() - started, 3)
+            if attrs.get('error'):
+                record['status'] = 'error'
+            with self._lock:
+                self.spans.append(record)
+
+    def summary(self):
+        phases = {}
+        with self._lock:
+            spans = list(self.spans)
+        for sp in spans:
+            ph = phases.setdefault(sp['name'], {'count': 0, 'sum': 0.0, 'max': 0.0, 'errors': 0})
+            ph['count'] += 1
+            ph['sum'] += sp['duration']
+            ph['max'] = max(ph['max'], sp['duration'])
+            ph['errors'] += sp['status'] == 'error'
+        return spans, phases
+
+    def export(self, trace_path, metrics_path, gauges=None):
+        spans, phases = self.summary()
+        run_seconds = time.time() - self.started
+        try:
+            with open(trace_path, 'w', encoding='utf-8') as f:
+                json.dump({'started_at': self.started, 'duration': round(run_seconds, 3),
+                           'phases': phases, 'spans': spans}, f, ensure_ascii=False, indent=2, default=str)
+
+            lines = [
+                "# HELP okru_bot_phase_seconds Длительность фаз работы бота",
+                "# TYPE okru_bot_phase_seconds summary"
+            ]
+            for name, ph in sorted(phases.items()):
+                lines.append(f'okru_bot_phase_seconds_sum{{phase="{name}"}} {ph["sum"]:.3f}')
+                lines.append(f'okru_bot_phase_seconds_count{{phase="{name}"}} {ph["count"]}')
+            lines += ["# HELP okru_bot_phase_max_seconds Самая долгая фаза за запуск",
+                      "# TYPE okru_bot_phase_max_seconds gauge"]
+            lines += [f'okru_bot_phase_max_seconds{{phase="{name}"}} {ph["max"]:.3f}' for name, ph in sorted(phases.items())]
+            lines += ["# HELP okru_bot_phase_errors Число фаз, завершившихся ошибкой",
+                      "# TYPE okru_bot_phase_errors gauge"]
+            lines += [f'okru_bot_phase_errors{{phase="{name}"}} {ph["errors"]}' for name, ph in sorted(phases.items())]
+            lines += ["# HELP okru_bot_run_seconds Длительность запуска",
+                      "# TYPE okru_bot_run_seconds gauge",
+                      f"okru_bot_run_seconds {run_seconds:.3f}",
+                      "# HELP okru_bot_last_run_timestamp_seconds Время окончания запуска",
+                      "# TYPE okru_bot_last_run_timestamp_seconds gauge",
+                      f"okru_bot_last_run_timestamp_seconds {time.time():.0f}"]
+            for name, (help_text, value) in sorted((gauges or {}).items()):
+                lines += [f"# HELP okru_bot_{name} {help_text}",
+                          f"# TYPE okru_bot_{name} gauge",
+                          f"okru_bot_{name} {value}"]
+            # Пишем через временный файл, чтобы node_exporter не прочитал его наполовину
+            tmp_path = metrics_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write("\n".join(lines) + "\n")
+            os.replace(tmp_path, metrics_path)
+            logger.info(f"📊 Трейс сохранён: {trace_path}, метрики: {metrics_path}")
+        except OSError as e:
+            logger.warning(f"⚠️ Не удалось сохранить трейс: {e}")
+
+# В режиме демона храним только последние span'ы, чтобы память не росла
+tracer = Tracer(max_spans=int(os.getenv("TRACE_MAX_SPANS", "10000")))
+TRACE_FILE = os.getenv("TRACE_FILE", "trace.json")
+METRICS_FILE = os.getenv("METRICS_FILE", "bot_metrics.prom")
+
+# Единый long polling getUpdates с постоянным offset.
+# Сообщения раздаются зарегистрированным обработчикам (SMS-код, #группы, #пост),
+# а неразобранные сохраняются, чтобы команда, отправленная заранее, не терялась.
+class UpdateDispatcher:
+    def __init__(self, api, chat_id, long_poll_timeout=30, backlog_size=100):
+        self.api = api
+        self.chat_id = chat_id
+        self.long_poll_timeout = long_poll_timeout
+        self.offset = None
+        self._lock = threading.Lock()
+        self._waiters = []
+        self._backlog = deque(maxlen=backlog_size)
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread:
+            return
+        self._skip_pending()
+        self._thread = threading.Thread(target=self._run, name="telegram-updates", daemon=True)
+        self._thread.start()
+        logger.info("📡 Слушаю команды из Telegram")
+
+    def stop(self):
+        self._stopping.set()
+
+    def _skip_pending(self):
+        # Старые команды, отправленные до запуска, игнорируем
+        try:
+            init = self.api.call("getUpdates", params={'timeout': 0, 'offset': -1})
+            ids = [u['update_id'] for u in init.get('result', [])]
+            if ids:
+                self.offset = max(ids) + 1
+        except:
+            pass
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                resp = self.api.call("getUpdates", params={
+                    'timeout': self.long_poll_timeout,
+                    'offset': self.offset
+                }, timeout=self.long_poll_timeout + 10, retries=1)
+            except:
+                self._stopping.wait(5)
+                continue
+            if not resp.get('ok'):
+                self._stopping.wait(5)
+                continue
+
+            for upd in resp['result']:
+                self.offset = upd['update_id'] + 1
+                edited = 'message' not in upd
+                msg = upd.get('message') or upd.get('edited_message')
+                if not msg or str(msg.get('chat', {}).get('id')) != self.chat_id:
+                    continue
+                self._dispatch(msg, edited)
+
+    def _dispatch(self, msg, edited=False):
+        # Исправленные сообщения получают только те, кто их ждёт (SMS-код),
+        # иначе правка уже обработанной команды запустила бы её второй раз
+        with self._lock:
+            for i, (matcher, future, edits, since) in enumerate(self._waiters):
+                if not self._accepts(msg, edited, edits, since):
+                    continue
+                result = self._match(matcher, msg)
+                if result is not None:
+                    del self._waiters[i]
+                    future.set_result(result)
+                    return
+            self._backlog.append((msg, edited))
+
+    @staticmethod
+    def _accepts(msg, edited, edits, since):
+        # since отсекает сообщения, отправленные до начала ожидания (например, старый SMS-код)
+        if edited and not edits:
+            return False
+        return since is None or msg.get('edit_date', msg.get('date', 0)) >= since
+
+    @staticmethod
+    def _match(matcher, msg):
+        try:
+            return matcher(msg)
+        except Exception as e:
+            logger.warning(f"⚠️ Ошибка разбора сообщения: {e}")
+            return None
+
+    def expect(self, matcher, edits=False, since=None):
+        future = Future()
+        with self._lock:
+            for item in list(self._backlog):
+                msg, edited = item
+                if not self._accepts(msg, edited, edits, since):
+                    continue
+                result = self._match(matcher, msg)
+                if result is not None:
+                    self._backlog.remove(item)
+                    future.set_result(result)
+                    return future
+            self._waiters.append((matcher, future, edits, since))
+        return future
+
+    def wait_for(self, matcher, timeout=None, edits=False, since=None):
+        self.start()
+        future = self.expect(matcher, edits, since)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self._waiters = [w for w in self._waiters if w[1] is not future]
+            raise TimeoutException("Сообщение не получено")
+
+updates = UpdateDispatcher(
+    bot_api, TELEGRAM_USER_ID,
+    long_poll_timeout=int(os.getenv("TELEGRAM_POLL_TIMEOUT", "30"))
+)
+
+# Определение установленной версии Chrome без сети
+def detect_chrome_major():
+    candidates = [uc.find_chrome_executable()] + [
+        shutil.which(name) for name in ("google-chrome", "google-chrome-stable", "chromium", "chromium-browser")
+    ]
+    for exe in candidates:
+        if not exe:
+            continue
+        try:
+            out = subprocess.run([exe, "--version"], capture_output=True, text=True, timeout=10).stdout
+        except (OSError, subprocess.SubprocessError):
+            continue
+        m = re.search(r"(\d+)\.\d+\.\d+\.\d+", out)
+        if m:
+            return int(m.group(1))
+    env_major = os.getenv("CHROME_MAJOR")
+    return int(env_major) if env_major else None
+
+# Кэш пропатченного chromedriver по мажорной версии Chrome
+DRIVER_CACHE_DIR = os.getenv("DRIVER_CACHE_DIR", os.path.expanduser("~/.okru_bot/chromedriver"))
+
+def cached_driver_path(version_main):
+    name = "chromedriver.exe" if os.name == 'nt' else "chromedriver"
+    return os.path.join(DRIVER_CACHE_DIR, str(version_main), name)
+
+def store_patched_driver(instance, path):
+    try:
+        src = instance.patcher.executable_path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"  # кэш могут заполнять несколько процессов
+        shutil.copy2(src, tmp_path)
+        os.chmod(tmp_path, 0o755)
+        os.replace(tmp_path, path)
+        logger.info(f"💾 Chromedriver сохранён в кэш: {path}")
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось сохранить chromedriver в кэш: {e}")
+
+def chrome_options():
     opts = uc.ChromeOptions()
 
     # Используем headless, но не new (для совместимости с Xvfb)
-    if os.getenv('DISPLAY'):
-        logger.info("🖥️ Обнаружен DISPLAY, работаем с Xvfb")
-    else:
+    if not os.getenv('DISPLAY'):
         opts.add_argument('--headless=new')
-        logger.info("🔇 Работаем в headless режиме")
 
     opts.add_argument('--no-sandbox')
     opts.add_argument('--disable-dev-shm-usage')
@@ -81,85 +502,505 @@ def init_driver():
         "profile.default_content_setting_values.automatic_downloads": 1
     }
     opts.add_experimental_option("prefs", prefs)
-
-    version_main = int(os.getenv("CHROME_MAJOR", "136"))
-
+    # Performance-лог нужен для статистики загрузки страниц
+    opts.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    return opts
+
+# Облегчённая загрузка страниц: через CDP блокируются картинки, шрифты,
+# реклама и счётчики, которые не нужны для входа и формы постинга
+LEAN_MODE = os.getenv("LEAN_MODE", "1") == "1"
+LEAN_BLOCKED_URLS = [
+    "*.jpg", "*.jpeg", "*.png", "*.gif", "*.webp", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf",
+    "*i.mycdn.me/i?*",
+    "*mc.yandex.ru*", "*an.yandex.ru*", "*top-fwz1.mail.ru*", "*ad.mail.ru*", "*ads.adfox.ru*",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*"
+] + [u.strip() for u in os.getenv("LEAN_EXTRA_BLOCKED_URLS", "").split(",") if u.strip()]
+
+def apply_lean_mode(instance):
     try:
-        driver = uc.Chrome(options=opts, version_main=version_main)
-        logger.info(f"✅ Chrome инициализирован с версией {version_main}")
-        return driver
+        instance.execute_cdp_cmd("Network.enable", {})
+        instance.execute_cdp_cmd("Network.setBlockedURLs", {"urls": LEAN_BLOCKED_URLS})
+        logger.info(f"🪶 Облегчённый режим: блокируется {len(LEAN_BLOCKED_URLS)} шаблонов URL")
     except Exception as e:
-        logger.error(f"❌ Ошибка инициализации драйвера с версией {version_main}: {e}")
+        logger.warning(f"⚠️ Не удалось включить облегчённый режим: {e}")
+
+# События сети из performance-лога Chrome (лог очищается при чтении)
+def read_network_events():
+    events = []
+    try:
+        entries = driver.get_log('performance')
+    except Exception:
+        return events
+    for entry in entries:
         try:
-            driver = uc.Chrome(options=opts)
-            logger.info("✅ Chrome инициализирован без указания версии")
-            return driver
-        except Exception as e2:
-            logger.error(f"❌ Критическая ошибка инициализации драйвера: {e2}")
-            raise
+            msg = json.loads(entry['message'])['message']
+        except (KeyError, ValueError):
+            continue
+        if msg.get('method', '').startswith('Network.'):
+            events.append(msg)
+    return events
+
+# Загрузка страницы со статистикой запросов и трафика
+def load_page(url, label):
+    read_network_events()  # сбрасываем события предыдущей страницы
+    started = time.time()
+    driver.get(url)
+    total = blocked = loaded_bytes = 0
+    for event in read_network_events():
+        params = event.get('params', {})
+        if event['method'] == 'Network.requestWillBeSent':
+            total += 1
+        elif event['method'] == 'Network.loadingFinished':
+            loaded_bytes += params.get('encodedDataLength', 0)
+        elif event['method'] == 'Network.loadingFailed' and params.get('blockedReason'):
+            blocked += 1
+    logger.info(f"📉 {label}: {time.time() - started:.1f} сек, запросов {total}, "
+                f"заблокировано {blocked}, загружено {loaded_bytes // 1024} КБ")
+
+# Инициализация WebDriver
+def init_driver():
+    if os.getenv('DISPLAY'):
+        logger.info("🖥️ Обнаружен DISPLAY, работаем с Xvfb")
+    else:
+        logger.info("🔇 Работаем в headless режиме")
 
-driver = init_driver()
+    started = time.time()
+    version_main = detect_chrome_major()
+    cached = cached_driver_path(version_main) if version_main else None
+
+    # ChromeOptions нельзя переиспользовать между попытками, поэтому создаём заново
+    attempts = []
+    if cached and os.path.exists(cached):
+        attempts.append(("кэшированный драйвер", {'version_main': version_main, 'driver_executable_path': cached}))
+    if version_main:
+        attempts.append((f"версия {version_main}", {'version_main': version_main}))
+    attempts.append(("без указания версии", {}))
+
+    last_error = None
+    for label, kwargs in attempts:
+        try:
+            driver = uc.Chrome(options=chrome_options(), **kwargs)
+        except Exception as e:
+            logger.error(f"❌ Ошибка инициализации драйвера ({label}): {e}")
+            last_error = e
+            continue
+
+        logger.info(f"✅ Chrome инициализирован ({label}) за {time.time() - started:.1f} сек")
+        if LEAN_MODE:
+            apply_lean_mode(driver)
+        if 'driver_executable_path' not in kwargs:
+            major = version_main or int(driver.capabilities.get('browserVersion', '0').split('.')[0])
+            if major:
+                store_patched_driver(driver, cached_driver_path(major))
+        return driver
+
+    logger.error(f"❌ Критическая ошибка инициализации драйвера: {last_error}")
+    raise last_error
+
+# Драйвер текущего потока: при параллельном постинге каждый поток
+# привязывает свой экземпляр Chrome, остальной код работает с `driver` как обычно
+class DriverProxy:
+    def __init__(self, default=None):
+        self.default = default
+        self._local = threading.local()
+
+    def bind(self, instance):
+        self._local.driver = instance
+
+    def current(self):
+        return getattr(self._local, 'driver', None) or self.default
+
+    def __getattr__(self, name):
+        return getattr(self.current(), name)
+
+# Основной Chrome создаётся в start_browser, параллельно с приёмом команд
+driver = DriverProxy()
 wait = WebDriverWait(driver, 20)
 
+# Ожидание состояния страницы без опроса: в страницу внедряется MutationObserver,
+# который проверяет условие при каждом изменении DOM и сразу возвращает результат.
+# condition - тело JS-функции, возвращающей непустое значение, когда условие выполнено.
+DOM_WAIT_SCRIPT = """
+const check = function () {
+__CONDITION__
+};
+const timeoutMs = arguments[0];
+const done = arguments[arguments.length - 1];
+const evaluate = () => { try { return check(); } catch (e) { return null; } };
+const first = evaluate();
+if (first) { done(first); return; }
+let finished = false;
+const observer = new MutationObserver(() => { const v = evaluate(); if (v) finish(v); });
+const interval = setInterval(() => { const v = evaluate(); if (v) finish(v); }, 500);
+const timer = setTimeout(() => finish(null), timeoutMs);
+function finish(value) {
+    if (finished) return;
+    finished = true;
+    observer.disconnect();
+    clearInterval(interval);
+    clearTimeout(timer);
+    done(value);
+}
+observer.observe(document.documentElement, {subtree: true, childList: true, attributes: true, characterData: true});
+"""
+# Один вызов не должен превышать стандартный script timeout WebDriver (30 сек)
+DOM_WAIT_SLICE = 25
+# Ошибки, после которых ожидание можно повторить: страница сменилась посреди скрипта
+DOM_WAIT_RETRY_ERRORS = ("document unloaded", "target navigated", "execution context was destroyed", "script timeout")
+
+def wait_for_dom(condition, timeout):
+    deadline = time.time() + timeout
+    while True:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return None
+        try:
+            # Условие вставляется в текст скрипта, а не через new Function: CSP без 'unsafe-eval' его не пропустит
+            result = driver.execute_async_script(
+                DOM_WAIT_SCRIPT.replace("__CONDITION__", condition), int(min(remaining, DOM_WAIT_SLICE) * 1000)
+            )
+        except WebDriverException as e:
+            # Скрипт прерывается при переходе на другую страницу - пробуем снова, остальное пробрасываем
+            if not any(marker in str(e).lower() for marker in DOM_WAIT_RETRY_ERRORS):
+                raise
+            time.sleep(0.2)
+            continue
+        if result:
+            return result
+
+# Снимок состояния формы постинга за один вызов execute_script:
+# состояние кнопки Share, текст первой ошибки загрузки и видимые ссылки на пост
+POSTING_PROBE_JS = """
+function probePosting() {
+    const b = document.querySelector("button.js-pf-submit-btn[data-action='submit']");
+    const err = document.querySelector(".upload-error, .error-message, div[data-state='error'], .js-upload-error");
+    const links = [];
+    const tips = document.querySelectorAll("#hook_Block_TipBlock .js-tip-block-url, .tip-block_lk a.js-tip-block-url, "
+        + ".action-tip a[href*='/topic/'], .toast a[href*='/topic/']");
+    for (const el of tips) {
+        if (el.offsetParent !== null && el.href && el.href.includes('/topic/')) links.push(el.href);
+    }
+    // Прогресс загрузки видео в процентах: aria-атрибут, ширина полосы или текст "NN%"
+    let progress = null;
+    const bar = document.querySelector("[role='progressbar'][aria-valuenow]");
+    if (bar) progress = parseFloat(bar.getAttribute('aria-valuenow'));
+    if (progress === null) {
+        for (const el of document.querySelectorAll("[class*='progress']")) {
+            const width = el.style && el.style.width;
+            const m = width && width.endsWith('%') ? [null, width] : (el.innerText || '').match(/(\\d{1,3}(?:[.,]\\d+)?)\\s*%/);
+            if (m) { progress = parseFloat(String(m[1]).replace(',', '.')); break; }
+        }
+    }
+    return {share_disabled: b ? b.disabled : null, error: err ? (err.innerText || '') : null,
+            topic_links: links, progress: isNaN(progress) ? null : progress};
+}
+"""
+
+def probe_posting_state():
+    return driver.execute_script(POSTING_PROBE_JS + "return probePosting();")
+
+# Условия для wait_for_dom поверх того же снимка
+SHARE_ENABLED_JS = POSTING_PROBE_JS + """
+const s = probePosting();
+return s.share_disabled === false ? s : null;
+"""
+
+UPLOAD_STATE_JS = POSTING_PROBE_JS + """
+const s = probePosting();
+return s.error !== null || s.share_disabled === false ? s : null;
+"""
+
+TOPIC_LINK_JS = POSTING_PROBE_JS + """
+const s = probePosting();
+return s.topic_links.length ? s : null;
+"""
+
+# Поле выбора файла обычно скрыто, поэтому для него проверяется видимость обёртки
+VIDEO_DIALOG_JS = """
+const els = document.querySelectorAll(".js-fileapi-input.video-upload-input, input.video-upload-input, "
+    + ".video-upload-wrapper input[type='file'], .js-upload-button input[type='file'], "
+    + "input[type='file'][accept*='video'], [data-l*='myVideos'], .js-my-videos");
+for (const el of els) {
+    const shown = el.type === 'file' ? el.parentElement : el;
+    if (shown && shown.offsetParent !== null) return true;
+}
+return null;
+"""
+
+# Реестр селекторов: для каждого логического элемента запоминается,
+# какой из запасных селекторов сработал, и в следующий раз он проверяется первым.
+# Все кандидаты проверяются одним ожиданием с общим дедлайном.
+class SelectorRegistry:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.data = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"  # реестр общий для процессов аккаунтов
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(self.data, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.warning(f"⚠️ Не удалось сохранить реестр селекторов: {e}")
+
+    def ordered(self, name, candidates):
+        with self._lock:
+            entry = self.data.get(name, {})
+        wins = entry.get('wins', {})
+        last = entry.get('last')
+        return sorted(candidates, key=lambda sel: (sel != last, -wins.get(sel, 0), candidates.index(sel)))
+
+    def record(self, name, ordered, matched):
+        with self._lock:
+            entry = self.data.setdefault(name, {'wins': {}, 'last': None, 'hits': 0, 'misses': 0, 'failures': 0})
+            if matched is None:
+                entry['failures'] += 1
+            else:
+                entry['hits' if matched == ordered[0] else 'misses'] += 1
+                entry['wins'][matched] = entry['wins'].get(matched, 0) + 1
+                entry['last'] = matched
+        self.save()
+
+    def stats(self):
+        with self._lock:
+            return {name: {k: e[k] for k in ('hits', 'misses', 'failures', 'last')} for name, e in self.data.items()}
+
+selector_registry = SelectorRegistry(
+    os.getenv("SELECTOR_CACHE_FILE", os.path.expanduser("~/.okru_bot/selectors.json"))
+)
+
+def find_first(name, candidates, timeout=10, visible=False):
+    ordered = selector_registry.ordered(name, candidates)
+    condition = (
+        f"const sels = {json.dumps(ordered)};"
+        "for (const s of sels) {"
+        "  const el = document.querySelector(s);"
+        f"  if (el && {'el.offsetParent !== null' if visible else 'true'}) return s;"
+        "}"
+        "return null;"
+    )
+    with tracer.span(f"find_{name}") as span:
+        matched = wait_for_dom(condition, timeout)
+        span['selector'] = matched
+        if not matched:
+            span['error'] = "не найден"
+    selector_registry.record(name, ordered, matched)
+    if not matched:
+        return None, None
+    return driver.find_element(By.CSS_SELECTOR, matched), matched
+
+# Сбор артефактов при ошибках: снимок экрана и кусок DOM снимаются с драйвера
+# быстро, а декодирование, сжатие и запись на диск идут в фоновом потоке.
+# На диске хранится не больше ARTIFACT_MAX_FILES наборов и ARTIFACT_MAX_MB мегабайт,
+# старые наборы вытесняются первыми.
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "artifacts")
+ARTIFACT_MAX_FILES = int(os.getenv("ARTIFACT_MAX_FILES", "30"))
+ARTIFACT_MAX_MB = int(os.getenv("ARTIFACT_MAX_MB", "50"))
+ARTIFACT_DOM_LIMIT = int(os.getenv("ARTIFACT_DOM_LIMIT", "200000"))  # символов
+ARTIFACT_BUNDLE = os.getenv("ARTIFACT_BUNDLE", "")  # путь к zip для выгрузки, пусто — без архива
+
+class ArtifactCollector:
+    def __init__(self, directory, max_files, max_bytes, dom_limit):
+        self.directory = directory
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.dom_limit = dom_limit
+        self.queue = queue.Queue()
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def capture(self, name):
+        # Снимаем данные в потоке вызывающего, пока страница не изменилась
+        with self._lock:
+            self._seq += 1
+            stem = f"{int(time.time())}_{self._seq:03d}_{name}"
+            if not self._worker:
+                self._worker = threading.Thread(target=self._run, name="artifacts", daemon=True)
+                self._worker.start()
+        try:
+            shot = driver.execute_cdp_cmd("Page.captureScreenshot", {"format": "jpeg", "quality": 70})['data']
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось снять скриншот: {e}")
+            shot = None
+        try:
+            dom = driver.execute_script(
+                "return [location.href, document.documentElement.outerHTML.slice(0, arguments[0])];",
+                self.dom_limit
+            )
+        except Exception:
+            dom = None
+        if shot is None and dom is None:
+            return None
+        self.queue.put((stem, shot, dom))
+        logger.info(f"📸 Артефакт ошибки: {stem}")
+        return stem
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                self._write(*item)
+                self._trim()
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось сохранить артефакт: {e}")
+            finally:
+                self.queue.task_done()
+
+    def _write(self, stem, shot, dom):
+        os.makedirs(self.directory, exist_ok=True)
+        if shot:
+            with open(os.path.join(self.directory, f"{stem}.jpg"), 'wb') as f:
+                f.write(base64.b64decode(shot))
+        if dom:
+            url, html = dom
+            with gzip.open(os.path.join(self.directory, f"{stem}.html.gz"), 'wt', encoding='utf-8') as f:
+                f.write(f"<!-- {url} -->\n{html}")
+
+    def _trim(self):
+        # Наборы (скриншот + DOM) группируются по общему префиксу имени
+        sets = {}
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            sets.setdefault(name.split('.', 1)[0], []).append(path)
+        total = sum(os.path.getsize(p) for paths in sets.values() for p in paths)
+        for stem in sorted(sets):
+            if len(sets) <= self.max_files and total <= self.max_bytes:
+                break
+            for path in sets.pop(stem):
+                total -= os.path.getsize(path)
+                os.unlink(path)
+
+    def flush(self, timeout=30):
+        # Дожидаемся записи всего, что уже снято
+        if not self._worker:
+            return
+        self.queue.put(None)
+        self._worker.join(timeout=timeout)
+        self._worker = None
+
+    def bundle(self, path):
+        if not os.path.isdir(self.directory) or not os.listdir(self.directory):
+            return None
+        base = path[:-4] if path.endswith('.zip') else path
+        archive = shutil.make_archive(base, 'zip', self.directory)
+        logger.info(f"📦 Артефакты ошибок упакованы: {archive}")
+        return archive
+
+artifacts = ArtifactCollector(ARTIFACT_DIR, ARTIFACT_MAX_FILES, ARTIFACT_MAX_MB * 1024 * 1024, ARTIFACT_DOM_LIMIT)
+
 # Функция для создания скриншота при ошибках
 def take_screenshot(name="error"):
     try:
-        timestamp = int(time.time())
-        filename = f"{name}_{timestamp}.png"
-        driver.save_screenshot(filename)
-        logger.info(f"📸 Скриншот сохранен: {filename}")
-        return filename
+        return artifacts.capture(name)
     except Exception as e:
         logger.error(f"❌ Не удалось создать скриншот: {e}")
         return None
 
-# Отправка ссылки на пост в Telegram
-def send_post_link_to_telegram(post_link):
-    try:
-        full_url = f"https://ok.ru{post_link}" if post_link.startswith('/') else post_link
-        message = f"✅ Пост опубликован: {full_url}"
-
-        api_url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-        response = requests.post(api_url, data={
-            "chat_id": TELEGRAM_USER_ID,
-            "text": message
-        })
-
-        if response.json().get('ok'):
-            logger.info(f"📤 Ссылка отправлена в Telegram: {full_url}")
+# Отчёт о публикациях в Telegram: результат по каждой группе отправляется сразу,
+# как только он готов, а строки склеиваются в несколько сообщений
+def full_post_url(post_link):
+    return f"{OK_BASE_URL}{post_link}" if post_link.startswith('/') else post_link
+
+class ResultReporter:
+    def __init__(self, api, chat_id, total, flush_interval=3.0):
+        self.batcher = MessageBatcher(api, chat_id, flush_interval, name="telegram-results")
+        self.total = total
+        self.posted = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def report(self, result):
+        with self._lock:
+            if result['link']:
+                self.posted += 1
+            else:
+                self.failed += 1
+        if result['link']:
+            full_url = full_post_url(result['link'])
+            self.batcher.put(f"✅ Пост опубликован: {full_url} ({result['duration']} сек)")
+            logger.info(f"📤 Ссылка поставлена в отчёт: {full_url}")
         else:
-            logger.error(f"❌ Ошибка отправки в Telegram: {response.text}")
+            self.batcher.put(f"❌ {result['group']}: {result['error']} ({result['duration']} сек)")
+
+    def close(self):
+        self.batcher.put(f"📊 Опубликовано {self.posted}/{self.total}, ошибок {self.failed}")
+        self.batcher.close()
+
+# Поиск id опубликованного поста в ответе на запрос публикации. События сети
+# сбрасываются перед кликом по Share, поэтому первый POST формы постинга после
+# клика — запрос самой публикации; id читается только из его ответа.
+POSTING_XHR_RE = re.compile(r"post|topic|share", re.IGNORECASE)
+TOPIC_ID_RE = re.compile(r"[\"']?topic_?[iI]d[\"']?\s*[:=]\s*[\"']?(\d+)")
+
+def find_post_link_in_network(group_url, publish):
+    group_id = re.search(r"/group/(\d+)", group_url)
+    for event in read_network_events():
+        params = event.get('params', {})
+        if event['method'] == 'Network.requestWillBeSent' and not publish.get('request_id'):
+            request = params.get('request', {})
+            url = request.get('url', '')
+            if request.get('method') == 'POST' and OK_HOST in url and POSTING_XHR_RE.search(url):
+                publish['request_id'] = params['requestId']
+        elif event['method'] == 'Network.loadingFinished' and params.get('requestId') == publish.get('request_id'):
+            publish['finished'] = True
+            try:
+                response = driver.execute_cdp_cmd("Network.getResponseBody", {"requestId": params['requestId']})
+            except Exception:
+                return None
+            if response.get('base64Encoded'):
+                return None
+            body = response.get('body', '').replace('\\/', '/')
 
-    except Exception as e:
-        logger.error(f"❌ Ошибка отправки ссылки в Telegram: {e}")
+            if group_id:
+                ids = re.findall(rf"/group/{group_id.group(1)}/topic/(\d+)", body)
+                if ids:
+                    return f"{OK_BASE_URL}/group/{group_id.group(1)}/topic/{max(ids, key=int)}"
+            m = TOPIC_ID_RE.search(body)
+            if m:
+                return f"{group_url.rstrip('/')}/topic/{m.group(1)}"
+            return None
+    return None
 
-# Поиск ссылки на опубликованный пост
-def wait_for_post_link(timeout=30):
+# Поиск ссылки на опубликованный пост: сначала в сетевых ответах,
+# уведомление со ссылкой в DOM проверяется как запасной вариант
+def wait_for_post_link(timeout=30, group_url=None):
     try:
         logger.info("⏳ Ищу ссылку на опубликованный пост...")
-        tip_selectors = [
-            "#hook_Block_TipBlock .js-tip-block-url",
-            ".tip-block_lk a.js-tip-block-url",
-            ".action-tip a[href*='/topic/']",
-            ".toast a[href*='/topic/']"
-        ]
-
-        for i in range(timeout):
-            for selector in tip_selectors:
-                try:
-                    elems = driver.find_elements(By.CSS_SELECTOR, selector)
-                    for el in elems:
-                        if el.is_displayed():
-                            post_link = el.get_attribute("href")
-                            if post_link and "/topic/" in post_link:
-                                logger.info(f"✅ Найдена ссылка на пост: {post_link}")
-                                return post_link
-                except:
-                    continue
-
-            time.sleep(1)
-            if i % 10 == 0 and i > 0:
-                logger.info(f"⏳ Поиск ссылки на пост... ({i}/{timeout} сек)")
+        publish = {}
+        started = time.time()
+        next_report = 10
+        while time.time() - started < timeout:
+            if group_url and not publish.get('finished'):
+                post_link = find_post_link_in_network(group_url, publish)
+                if post_link:
+                    logger.info(f"✅ Ссылка на пост получена из ответа сервера: {post_link}")
+                    return post_link
+
+            state = wait_for_dom(TOPIC_LINK_JS, 0.5)
+            if state:
+                post_link = state['topic_links'][0]
+                logger.info(f"✅ Найдена ссылка на пост: {post_link}")
+                return post_link
+
+            elapsed = time.time() - started
+            if elapsed >= next_report and elapsed < timeout:
+                logger.info(f"⏳ Поиск ссылки на пост... ({next_report}/{timeout} сек)")
+                next_report += 10
 
         logger.warning("⚠️ Ссылка на пост не найдена в течение таймаута")
         return None
@@ -183,49 +1024,34 @@ def try_confirm_identity():
         logger.info("ℹ️ Страница подтверждения личности не показана")
 
 # Получение SMS-кода из Telegram
-def retrieve_sms_code(timeout=120, poll=5):
-    api = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/getUpdates"
-    last = None
-    try:
-        init = requests.get(api, params={'timeout':0}).json()
-        ids = [u['update_id'] for u in init.get('result', [])]
-        last = max(ids)+1 if ids else None
-    except:
-        pass
-
-    deadline = time.time() + timeout
-    logger.info("⏳ Ожидаю SMS-код")
-    while time.time() < deadline:
-        try:
-            resp = requests.get(api, params={'timeout':0, 'offset': last}).json()
-        except:
-            time.sleep(poll)
-            continue
-        if not resp.get('ok'):
-            time.sleep(poll)
-            continue
-
-        for upd in resp['result']:
-            last = upd['update_id'] + 1
-            msg = upd.get('message') or upd.get('edited_message')
-            if not msg or str(msg.get('chat', {}).get('id')) != TELEGRAM_USER_ID:
-                continue
-            txt = msg.get('text','').strip()
-            m = re.match(r"^(?:#код\s*)?(\d{4,6})$", txt, re.IGNORECASE)
-            if m:
-                code = m.group(1)
-                logger.info("✅ Код получен")
-                return code
+def match_sms_code(msg):
+    txt = msg.get('text', '').strip()
+    m = re.match(r"^(?:#код\s*)?(\d{4,6})$", txt, re.IGNORECASE)
+    return m.group(1) if m else None
 
-        time.sleep(poll)
+# Код принимается только из сообщений, отправленных после запроса, чтобы не ввести
+# опоздавший код от прошлой попытки; небольшой запас — на расхождение часов с Telegram
+SMS_CLOCK_SKEW = 2
 
-    logger.error("❌ Таймаут SMS-кода")
-    raise TimeoutException("SMS-код не получен")
+def retrieve_sms_code(timeout=120):
+    logger.info("⏳ Ожидаю SMS-код")
+    requested = time.time() - SMS_CLOCK_SKEW
+    try:
+        with tracer.span("sms_wait"):
+            if shard_channel:
+                # В процессе аккаунта код получает координатор, он один читает getUpdates
+                code = shard_channel.request_sms(timeout)
+            else:
+                code = updates.wait_for(match_sms_code, timeout=timeout, edits=True, since=requested)
+    except TimeoutException:
+        logger.error("❌ Таймаут SMS-кода")
+        raise TimeoutException("SMS-код не получен")
+    logger.info("✅ Код получен")
+    return code
 
 # SMS-верификация
 def try_sms_verification():
-    data_l = driver.find_element(By.TAG_NAME,'body').get_attribute('data-l') or ''
-    if 'userMain' in data_l and 'anonymMain' not in data_l:
+    if is_logged_in():
         logger.info("✅ Уже залогинен")
         return
 
@@ -252,146 +1078,518 @@ def try_sms_verification():
     next_btn.click()
     logger.info("✅ SMS-верификация успешна")
 
+# Потоковое скачивание файла кусками прямо на диск.
+# Считает sha256 и число байт на лету, при обрыве докачивает через Range.
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+def stream_download(file_path, dest, expected_size=0, attempts=3):
+    digest = hashlib.sha256()
+    written = 0
+    with open(dest, 'wb') as f:
+        for attempt in range(attempts):
+            headers = {'Range': f'bytes={written}-'} if written else {}
+            try:
+                with bot_api.download(file_path, timeout=60, stream=True, headers=headers) as resp:
+                    if resp.status_code not in (200, 206):
+                        logger.error(f"❌ Ошибка скачивания файла: {resp.status_code}")
+                        return None
+                    if written and resp.status_code == 200:
+                        # Сервер проигнорировал Range - начинаем заново
+                        f.seek(0)
+                        f.truncate()
+                        digest = hashlib.sha256()
+                        written = 0
+                    for chunk in resp.iter_content(DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+                        digest.update(chunk)
+                        written += len(chunk)
+            except requests.RequestException as e:
+                logger.warning(f"⚠️ Обрыв скачивания на {written} байт ({attempt + 1}/{attempts}): {e}")
+                continue
+
+            if expected_size and written < expected_size:
+                logger.warning(f"⚠️ Получено {written} из {expected_size} байт, докачиваю")
+                continue
+            if expected_size and written != expected_size:
+                logger.error(f"❌ Размер файла не совпал: {written} вместо {expected_size} байт")
+                return None
+            return written, digest.hexdigest()
+
+    logger.error(f"❌ Не удалось скачать файл за {attempts} попыток")
+    return None
+
+# Локальный кэш видео по file_unique_id из Telegram.
+# Индекс хранит размер, sha256 и время последнего использования,
+# при превышении лимита удаляются давно не использованные файлы, кроме тех,
+# что ещё нужны заданиям в очереди (in_use возвращает их пути).
+class VideoCache:
+    def __init__(self, directory, max_bytes, in_use=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.in_use = in_use or (lambda: ())
+        self.index_path = os.path.join(directory, "index.json")
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.index = self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return {k: v for k, v in index.items() if os.path.exists(v.get('path', ''))}
+
+    def _save(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def get(self, key):
+        with self._lock:
+            entry = self.index.get(key)
+            if not entry:
+                return None
+            if not os.path.exists(entry['path']):
+                del self.index[key]
+                self._save()
+                return None
+            entry['last_used'] = time.time()
+            self._save()
+            return entry['path']
+
+    def put(self, key, src_path, sha256):
+        with self._lock:
+            path = os.path.join(self.directory, key + os.path.splitext(src_path)[1])
+            # Временный файл может лежать на другом разделе (tmpfs): копируем рядом и подменяем
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            shutil.move(src_path, tmp_path)
+            os.replace(tmp_path, path)
+            self.index[key] = {
+                'path': path,
+                'size': os.path.getsize(path),
+                'sha256': sha256,
+                'last_used': time.time()
+            }
+            self._evict(keep=(key,))
+            self._save()
+            return path
+
+    def contains_path(self, path):
+        with self._lock:
+            return any(e['path'] == path for e in self.index.values())
+
+    def sha256_of(self, path):
+        with self._lock:
+            return next((e['sha256'] for e in self.index.values() if e['path'] == path), None)
+
+    def evict(self):
+        with self._lock:
+            self._evict()
+            self._save()
+
+    def _evict(self, keep=()):
+        total = sum(e['size'] for e in self.index.values())
+        in_use = set(self.in_use())
+        for key, entry in sorted(self.index.items(), key=lambda kv: kv[1]['last_used']):
+            if total <= self.max_bytes:
+                break
+            if key in keep or entry['path'] in in_use:
+                continue
+            try:
+                os.unlink(entry['path'])
+            except OSError:
+                pass
+            total -= entry['size']
+            del self.index[key]
+            logger.info(f"🗑️ Видео {key} удалено из кэша ({entry['size']} байт)")
+
+video_cache = VideoCache(
+    # Рядом с сессией в ~/.okru_bot, чтобы кэш переживал запуски в GitHub Actions
+    os.getenv('VIDEO_CACHE_DIR', os.path.expanduser("~/.okru_bot/videos")),
+    int(os.getenv('VIDEO_CACHE_MAX_MB', '2048')) * 1024 * 1024
+)
+
+# Сохранённая сессия ok.ru: cookies и localStorage, зашифрованные ключом
+# из SESSION_KEY (по умолчанию - производным от пароля OK)
+SESSION_FILE = os.getenv("SESSION_FILE", os.path.expanduser("~/.okru_bot/session.bin"))
+
+def is_logged_in():
+    data_l = driver.find_element(By.TAG_NAME,'body').get_attribute('data-l') or ''
+    return 'userMain' in data_l and 'anonymMain' not in data_l
+
+def _session_cipher(salt):
+    secret = (os.getenv("SESSION_KEY") or PASSWORD).encode()
+    key = hashlib.pbkdf2_hmac('sha256', secret, salt, 200000)
+    return Fernet(base64.urlsafe_b64encode(key))
+
+def save_session():
+    try:
+        state = {
+            'cookies': driver.get_cookies(),
+            'local_storage': driver.execute_script("return Object.assign({}, window.localStorage);"),
+            'saved_at': time.time()
+        }
+        salt = os.urandom(16)
+        token = _session_cipher(salt).encrypt(json.dumps(state).encode())
+        os.makedirs(os.path.dirname(SESSION_FILE) or '.', exist_ok=True)
+        tmp_path = SESSION_FILE + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(salt + token)
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, SESSION_FILE)
+        logger.info("💾 Сессия сохранена")
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось сохранить сессию: {e}")
+
+def load_session():
+    if not os.path.exists(SESSION_FILE):
+        return None
+    try:
+        with open(SESSION_FILE, 'rb') as f:
+            data = f.read()
+        return json.loads(_session_cipher(data[:16]).decrypt(data[16:]))
+    except InvalidToken:
+        logger.warning("⚠️ Сохранённая сессия не расшифровывается, нужен полный вход")
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось прочитать сессию: {e}")
+    return None
+
+def restore_session():
+    state = load_session()
+    if not state:
+        return False
+
+    driver.get(OK_BASE_URL + "/")
+    for cookie in state.get('cookies', []):
+        try:
+            driver.add_cookie(cookie)
+        except Exception:
+            pass
+    driver.execute_script(
+        "const items = arguments[0]; for (const k in items) localStorage.setItem(k, items[k]);",
+        state.get('local_storage') or {}
+    )
+    driver.get(OK_BASE_URL + "/")
+
+    if is_logged_in():
+        age = int((time.time() - state.get('saved_at', time.time())) / 3600)
+        logger.info(f"♻️ Сессия восстановлена (возраст {age} ч)")
+        return True
+
+    logger.info("ℹ️ Сохранённая сессия истекла")
+    driver.delete_all_cookies()
+    return False
+
+# Вход: сначала пробуем сохранённую сессию, затем логин с SMS
+def login():
+    if restore_session():
+        return
+
+    load_page(OK_BASE_URL + "/", "Страница входа")
+    wait.until(EC.presence_of_element_located((By.NAME,'st.email'))).send_keys(EMAIL)
+    driver.find_element(By.NAME,'st.password').send_keys(PASSWORD)
+    logger.info("🔑 Логин")
+    driver.find_element(By.CSS_SELECTOR, "input[type='submit']").click()
+    time.sleep(2)
+
+    try_confirm_identity()
+    try_sms_verification()
+    save_session()
+
 # Скачивание файла из Telegram
-def download_file_from_telegram(file_id):
+external_files = set()  # файлы сервера Bot API: их нельзя удалять
+
+def download_file_from_telegram(file_id, file_unique_id=None):
+    temp_name = None
     try:
-        file_info_url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/getFile"
-        response = requests.get(file_info_url, params={'file_id': file_id})
-        file_info = response.json()
+        if file_unique_id:
+            cached = video_cache.get(file_unique_id)
+            if cached:
+                logger.info(f"♻️ Видео взято из кэша: {cached}")
+                return cached
+
+        file_info = bot_api.call("getFile", params={'file_id': file_id})
 
         if not file_info.get('ok'):
             logger.error(f"❌ Ошибка получения информации о файле: {file_info}")
             return None
 
         file_size = file_info['result'].get('file_size', 0)
-        if file_size > 20 * 1024 * 1024:
-            logger.error(f"❌ Файл слишком большой: {file_size} байт (лимит 20MB)")
+        if file_size > MAX_VIDEO_MB * 1024 * 1024:
+            logger.error(f"❌ Файл слишком большой: {file_size} байт (лимит {MAX_VIDEO_MB}MB)")
             return None
 
         file_path = file_info['result']['file_path']
-        file_url = f"https://api.telegram.org/file/bot{TELEGRAM_TOKEN}/{file_path}"
-        logger.info(f"📥 Скачиваю файл размером {file_size} байт")
+        if TELEGRAM_LOCAL_API and os.path.isabs(file_path):
+            if os.path.exists(file_path):
+                logger.info(f"📂 Файл на локальном сервере Bot API: {file_path} ({file_size} байт)")
+                external_files.add(file_path)
+                return file_path
+            logger.error(f"❌ Файл {file_path} от сервера Bot API не найден: бот и сервер должны работать с одним диском")
+            return None
 
-        file_response = requests.get(file_url, timeout=60)
-        if file_response.status_code == 200:
-            temp_dir = os.getenv('TEMP_VIDEO_DIR', tempfile.gettempdir())
-            os.makedirs(temp_dir, exist_ok=True)
-            temp_file = tempfile.NamedTemporaryFile(
-                delete=False,
-                suffix=os.path.splitext(file_path)[1],
-                dir=temp_dir
-            )
-            temp_file.write(file_response.content)
-            temp_file.close()
+        logger.info(f"📥 Скачиваю файл размером {file_size} байт")
 
-            if os.path.exists(temp_file.name):
-                actual_size = os.path.getsize(temp_file.name)
-                logger.info(f"✅ Файл скачан: {temp_file.name} ({actual_size} байт)")
-                return temp_file.name
-            else:
-                logger.error("❌ Файл не был сохранен")
-                return None
-        else:
-            logger.error(f"❌ Ошибка скачивания файла: {file_response.status_code}")
+        temp_dir = os.getenv('TEMP_VIDEO_DIR', tempfile.gettempdir())
+        os.makedirs(temp_dir, exist_ok=True)
+        temp_file = tempfile.NamedTemporaryFile(
+            delete=False,
+            suffix=os.path.splitext(file_path)[1],
+            dir=temp_dir
+        )
+        temp_file.close()
+        temp_name = temp_file.name
+
+        result = stream_download(file_path, temp_name, expected_size=file_size)
+        if not result:
+            os.unlink(temp_name)
             return None
 
+        actual_size, sha256 = result
+        logger.info(f"✅ Файл скачан: {temp_name} ({actual_size} байт, sha256 {sha256[:12]})")
+        file_unique_id = file_unique_id or file_info['result'].get('file_unique_id')
+        if file_unique_id:
+            return video_cache.put(file_unique_id, temp_name, sha256)
+        return temp_name
+
     except Exception as e:
         logger.error(f"❌ Ошибка при скачивании файла: {e}")
+        if temp_name and os.path.exists(temp_name):
+            os.unlink(temp_name)
         return None
 
 # Ожидание команды #группы и извлечение URL групп
-def retrieve_groups(poll=5):
-    api = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/getUpdates"
-    last = None
-    try:
-        init = requests.get(api, params={'timeout':0}).json()
-        ids = [u['update_id'] for u in init.get('result', [])]
-        last = max(ids)+1 if ids else None
-    except:
-        pass
-
+def match_groups(msg):
+    txt = msg.get('text', '').strip()
+    m = re.match(r"#группы\s+(.+)", txt, re.IGNORECASE)
+    if m:
+        urls = re.findall(rf"https?://{re.escape(OK_HOST)}/group/\d+/?", m.group(1))
+        if urls:
+            return urls
+    return None
+
+def retrieve_groups():
     logger.info("⏳ Жду команду #группы")
-    while True:
-        resp = requests.get(api, params={'timeout':0, 'offset': last}).json()
-        if resp.get('ok'):
-            for u in resp['result']:
-                last = u['update_id'] + 1
-                msg = u.get('message') or {}
-                if str(msg.get('chat', {}).get('id')) != TELEGRAM_USER_ID:
-                    continue
-                txt = msg.get('text','').strip()
-                m = re.match(r"#группы\s+(.+)", txt, re.IGNORECASE)
-                if m:
-                    urls = re.findall(r"https?://ok\.ru/group/\d+/?", m.group(1))
-                    if urls:
-                        logger.info("✅ Группы получены")
-                        return urls
-        time.sleep(poll)
+    urls = updates.wait_for(match_groups)
+    logger.info("✅ Группы получены")
+    return urls
 
 # Ожидание команды #пост и извлечение видео/текста
-def retrieve_post_info(poll=5):
-    api = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/getUpdates"
-    last = None
-    try:
-        init = requests.get(api, params={'timeout':0}).json()
-        ids = [u['update_id'] for u in init.get('result', [])]
-        last = max(ids)+1 if ids else None
-    except:
-        pass
+def match_post(msg):
+    txt = msg.get('text', '').strip()
+    caption = msg.get('caption', '').strip()
+    if txt:
+        post_match = re.match(r"#пост\s*(.*)", txt, re.IGNORECASE)
+    elif caption:
+        post_match = re.match(r"#пост\s*(.*)", caption, re.IGNORECASE)
+    else:
+        post_match = None
+    return (msg, post_match) if post_match else None
 
+def retrieve_post_info():
     logger.info("⏳ Жду команду #пост")
     while True:
-        resp = requests.get(api, params={'timeout':0, 'offset': last}).json()
-        if resp.get('ok'):
-            for u in resp['result']:
-                last = u['update_id'] + 1
-                msg = u.get('message') or {}
-                if str(msg.get('chat', {}).get('id')) != TELEGRAM_USER_ID:
-                    continue
+        msg, post_match = updates.wait_for(match_post)
+        txt = msg.get('text', '').strip()
+        caption = msg.get('caption', '').strip()
+
+        post_text = post_match.group(1).strip() if post_match.group(1) else ""
+        video_file = None
+        video_url = None
+
+        if 'video' in msg:
+            video_info = msg['video']
+            file_id = video_info['file_id']
+            logger.info("📹 Найдено видео в сообщении")
+            with tracer.span("download", file_size=video_info.get('file_size')) as span:
+                video_file = download_file_from_telegram(file_id, video_info.get('file_unique_id'))
+                if not video_file:
+                    span['error'] = "видео не скачано"
+
+        if not video_file:
+            full_text = (txt + " " + caption + " " + post_text).strip()
+            url_match = re.search(r"https?://\S+", full_text)
+            if url_match:
+                video_url = url_match.group(0)
+                post_text = full_text.replace(video_url, "").replace("#пост", "").strip()
+                logger.info("🔗 Найдена ссылка на видео")
+
+        if video_file or video_url:
+            logger.info("✅ Пост-инфо получено")
+            return video_file, video_url, post_text
+        else:
+            logger.warning("⚠️ Не найдено видео или ссылки в команде #пост")
+
+# Ожидание загрузки видео по реальному прогрессу: срок продлевается, пока
+# проценты растут, и загрузка считается зависшей, если прогресс стоит на месте.
+# Измеренная скорость сохраняется и используется как оценка в следующих запусках.
+UPLOAD_STATS_FILE = os.getenv("UPLOAD_STATS_FILE", os.path.expanduser("~/.okru_bot/upload_stats.json"))
+UPLOAD_STALL_TIMEOUT = int(os.getenv("UPLOAD_STALL_TIMEOUT", "60"))
+UPLOAD_MAX_WAIT = int(os.getenv("UPLOAD_MAX_WAIT", "1800"))
+UPLOAD_PROCESSING_GRACE = 120  # сек на обработку видео после 100%
+
+class UploadMonitor:
+    def __init__(self, file_size):
+        self.file_size = file_size
+        self.started = time.time()
+        self.last_progress = None
+        self.last_change = self.started
+        self.completed_at = None
+        expected = file_size / self.load_speed()
+        self.deadline = self.started + min(UPLOAD_MAX_WAIT, max(30, expected * 2))
+        self.hard_deadline = self.started + UPLOAD_MAX_WAIT
+
+    @staticmethod
+    def load_speed():
+        try:
+            with open(UPLOAD_STATS_FILE, encoding='utf-8') as f:
+                return max(64 * 1024, json.load(f)['speed_bps'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return 512 * 1024
+
+    def update(self, progress):
+        now = time.time()
+        if progress is None or (self.last_progress is not None and progress <= self.last_progress):
+            return
+        self.last_progress = progress
+        self.last_change = now
+        if progress >= 100:
+            self.completed_at = self.completed_at or now
+            self.deadline = max(self.deadline, now + UPLOAD_PROCESSING_GRACE)
+        else:
+            self.deadline = max(self.deadline, now + self.eta() * 1.5 + 15)
+        self.deadline = min(self.deadline, self.hard_deadline)
 
-                txt = msg.get('text', '').strip()
-                caption = msg.get('caption', '').strip()
-
-                post_match = None
-                if txt:
-                    post_match = re.match(r"#пост\s*(.*)", txt, re.IGNORECASE)
-                elif caption:
-                    post_match = re.match(r"#пост\s*(.*)", caption, re.IGNORECASE)
-
-                if post_match:
-                    post_text = post_match.group(1).strip() if post_match.group(1) else ""
-                    video_file = None
-                    video_url = None
-
-                    if 'video' in msg:
-                        video_info = msg['video']
-                        file_id = video_info['file_id']
-                        logger.info("📹 Найдено видео в сообщении")
-                        video_file = download_file_from_telegram(file_id)
-
-                    if not video_file:
-                        full_text = (txt + " " + caption + " " + post_text).strip()
-                        url_match = re.search(r"https?://\S+", full_text)
-                        if url_match:
-                            video_url = url_match.group(0)
-                            post_text = full_text.replace(video_url, "").replace("#пост", "").strip()
-                            logger.info("🔗 Найдена ссылка на видео")
-
-                    if video_file or video_url:
-                        logger.info("✅ Пост-инфо получено")
-                        return video_file, video_url, post_text
-                    else:
-                        logger.warning("⚠️ Не найдено видео или ссылки в команде #пост")
-        time.sleep(poll)
+    def speed(self):
+        if not self.last_progress:
+            return None
+        elapsed = (self.completed_at or self.last_change) - self.started
+        return self.file_size * min(self.last_progress, 100) / 100 / max(elapsed, 0.001)
+
+    def eta(self):
+        speed = self.speed()
+        if not speed:
+            return 0
+        return self.file_size * (100 - min(self.last_progress, 100)) / 100 / speed
+
+    def stalled(self):
+        return (self.last_progress is not None and self.last_progress < 100
+                and time.time() - self.last_change > UPLOAD_STALL_TIMEOUT)
+
+    def expired(self):
+        return time.time() > self.deadline
+
+    def save_speed(self):
+        speed = self.speed() if self.last_progress else self.file_size / max(time.time() - self.started, 0.001)
+        previous = self.load_speed()
+        # Сглаживаем, чтобы одна медленная загрузка не сбивала оценку
+        smoothed = speed if not os.path.exists(UPLOAD_STATS_FILE) else 0.7 * previous + 0.3 * speed
+        try:
+            os.makedirs(os.path.dirname(UPLOAD_STATS_FILE) or '.', exist_ok=True)
+            tmp_path = f"{UPLOAD_STATS_FILE}.{os.getpid()}.tmp"  # файл общий для процессов аккаунтов
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'speed_bps': smoothed, 'updated_at': time.time()}, f)
+            os.replace(tmp_path, UPLOAD_STATS_FILE)
+        except OSError as e:
+            logger.warning(f"⚠️ Не удалось сохранить скорость загрузки: {e}")
+        logger.info(f"📶 Скорость загрузки: {speed / 1024:.0f} КБ/с")
+
+# Однократная загрузка видео: id ролика, загруженного в первую группу,
+# запоминается, и в остальные группы он прикрепляется через «Мои видео»
+UPLOAD_ONCE = os.getenv("UPLOAD_ONCE", "1") == "1"
+uploaded_videos = {}  # путь к файлу -> id видео на ok.ru
+
+def form_video_ids():
+    # Id видео только внутри формы постинга: в ленте группы есть чужие ролики
+    try:
+        return driver.execute_script("""
+            const btn = document.querySelector("button.js-pf-submit-btn[data-action='submit']");
+            const form = btn && btn.closest("form, [class*='posting']");
+            if (!form) return [];
+            const ids = [];
+            for (const el of form.querySelectorAll("[data-movie-id], [data-video-id], a[href*='/video/']")) {
+                const href = el.getAttribute('href') || '';
+                const m = href.match(/\\/video\\/(\\d+)/);
+                const id = el.getAttribute('data-movie-id') || el.getAttribute('data-video-id') || (m && m[1]);
+                if (id && !ids.includes(String(id))) ids.push(String(id));
+            }
+            return ids;
+        """) or []
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось прочитать видео в форме: {e}")
+        return []
+
+def get_uploaded_video_id(before=()):
+    # Берём только ролик, появившийся в форме после загрузки файла
+    new_ids = [i for i in form_video_ids() if i not in before]
+    if len(new_ids) != 1:
+        logger.warning(f"⚠️ Не удалось однозначно определить id загруженного видео: {new_ids}")
+        return None
+    return new_ids[0]
+
+def wait_for_share_enabled(timeout):
+    return bool(wait_for_dom(SHARE_ENABLED_JS, timeout))
+
+def attach_existing_video(video_id, timeout=30):
+    my_videos_tabs = [
+        "//*[contains(@data-l,'myVideos') or contains(@data-l,'my_videos')]",
+        "//*[contains(@class,'js-my-videos')]",
+        "//a[contains(text(),'My videos')]",
+        "//a[contains(text(),'Мои видео')]"
+    ]
+    # Вкладка появляется не сразу после открытия окна - ждём видимую
+    found_tab = wait_for_dom(
+        f"const xps = {json.dumps(my_videos_tabs)};"
+        "for (const xp of xps) {"
+        "  const r = document.evaluate(xp, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);"
+        "  for (let i = 0; i < r.snapshotLength; i++) if (r.snapshotItem(i).offsetParent !== null) return xp;"
+        "}"
+        "return null;",
+        10
+    )
+    if found_tab:
+        tabs = [t for t in driver.find_elements(By.XPATH, found_tab) if t.is_displayed()]
+        if tabs:
+            tabs[0].click()
+            logger.info("📂 Открыл «Мои видео»")
+    else:
+        logger.warning("⚠️ Вкладка «Мои видео» не появилась за 10 сек")
+
+    item_selectors = [
+        f"[data-id='{video_id}']",
+        f"[data-movie-id='{video_id}']",
+        f"a[href*='/video/{video_id}']"
+    ]
+    found = wait_for_dom(
+        f"const sels = {json.dumps(item_selectors)};"
+        "for (const s of sels) { const el = document.querySelector(s); if (el && el.offsetParent !== null) return s; }"
+        "return null;",
+        10
+    )
+    if not found:
+        return False
+
+    driver.find_element(By.CSS_SELECTOR, found).click()
+    logger.info(f"🎞️ Выбрано загруженное видео {video_id}")
+    if wait_for_share_enabled(timeout):
+        logger.info("✅ Кнопка Share активирована - видео прикреплено!")
+        return True
+    return False
 
 # Постинг в группу (с улучшенной проверкой загрузки через активность кнопки Share)
-def post_to_group(group_url, video_file=None, video_url=None, text=""):
+def post_to_group(group_url, video_file=None, video_url=None, text="", on_state=None):
+    on_state = on_state or (lambda state: None)
     post_url = group_url.rstrip('/') + '/post'
+    if video_file and not os.path.exists(video_file):
+        # Без файла получился бы пост без видео
+        logger.error(f"❌ Видеофайл не найден: {video_file}")
+        return None
     logger.info("🚀 Открываю страницу постинга")
 
     try:
-        driver.get(post_url)
-        time.sleep(3)
+        load_page(post_url, "Страница постинга")
 
         box = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR,
             "div[contenteditable='true']"
@@ -406,8 +1604,7 @@ def post_to_group(group_url, video_file=None, video_url=None, text=""):
                 file_size = os.path.getsize(video_file)
                 logger.info(f"📁 Размер файла: {file_size} байт")
 
-                share_button = driver.find_element(By.CSS_SELECTOR, "button.js-pf-submit-btn[data-action='submit']")
-                initial_disabled = share_button.get_attribute("disabled") is not None
+                initial_disabled = probe_posting_state()['share_disabled'] is not False
                 logger.info(f"🔘 Начальное состояние кнопки Share: {'отключена' if initial_disabled else 'активна'}")
 
                 video_button_selectors = [
@@ -417,16 +1614,9 @@ def post_to_group(group_url, video_file=None, video_url=None, text=""):
                     "div[title='Add video']",
                     "div[aria-label='Add video']"
                 ]
-                video_button = None
-                for sel in video_button_selectors:
-                    try:
-                        btn = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, sel)))
-                        if btn.is_displayed():
-                            video_button = btn
-                            logger.info(f"🎬 Найдена кнопка Video: {sel}")
-                            break
-                    except:
-                        continue
+                video_button, sel = find_first("video_button", video_button_selectors, timeout=15, visible=True)
+                if video_button:
+                    logger.info(f"🎬 Найдена кнопка Video: {sel}")
 
                 if not video_button:
                     logger.error("❌ Не найдена кнопка Video")
@@ -435,69 +1625,89 @@ def post_to_group(group_url, video_file=None, video_url=None, text=""):
 
                 video_button.click()
                 logger.info("🎬 Кликнул на кнопку Video")
-                time.sleep(3)
-
-                upload_input_selectors = [
-                    ".js-fileapi-input.video-upload-input",
-                    "input.video-upload-input",
-                    ".video-upload-wrapper input[type='file']",
-                    ".js-upload-button input[type='file']",
-                    "input[type='file'][accept*='video']"
-                ]
-                upload_input = None
-                for sel in upload_input_selectors:
-                    try:
-                        inp = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, sel)))
-                        if inp:
-                            upload_input = inp
-                            logger.info(f"📤 Найден input для загрузки: {sel}")
-                            break
-                    except:
-                        continue
-
-                if not upload_input:
-                    logger.error("❌ Не найден input для загрузки файла")
-                    take_screenshot("no_upload_input")
-                    return
+                if not wait_for_dom(VIDEO_DIALOG_JS, 10):
+                    logger.warning("⚠️ Окно выбора видео не появилось за 10 сек")
 
-                upload_input.send_keys(video_file)
-                wait_time = min(120, max(30, file_size // (512 * 1024)))
-                logger.info(f"⏳ Жду активации кнопки Share ({wait_time} сек)...")
-
-                upload_success = False
-                for i in range(wait_time):
+                attached = False
+                known_video_id = uploaded_videos.get(video_file) if UPLOAD_ONCE else None
+                if known_video_id:
                     try:
-                        share_button = driver.find_element(By.CSS_SELECTOR, "button.js-pf-submit-btn[data-action='submit']")
-                        is_disabled = share_button.get_attribute("disabled") is not None
-                        if not is_disabled:
-                            upload_success = True
-                            logger.info("✅ Кнопка Share активирована - видео загружено!")
-                            break
-
-                        # Проверка ошибок загрузки
-                        error_selectors = [
-                            ".upload-error", ".error-message", "div[data-state='error']", ".js-upload-error"
-                        ]
-                        for es in error_selectors:
-                            errs = driver.find_elements(By.CSS_SELECTOR, es)
-                            if errs:
-                                logger.error(f"❌ Ошибка загрузки: {errs[0].text}")
+                        attached = attach_existing_video(known_video_id)
+                    except Exception as e:
+                        logger.warning(f"⚠️ Ошибка выбора видео из «Мои видео»: {e}")
+                    if not attached:
+                        logger.warning("⚠️ Не удалось прикрепить загруженное видео, загружаю файл заново")
+
+                if not attached:
+                    upload_input_selectors = [
+                        ".js-fileapi-input.video-upload-input",
+                        "input.video-upload-input",
+                        ".video-upload-wrapper input[type='file']",
+                        ".js-upload-button input[type='file']",
+                        "input[type='file'][accept*='video']"
+                    ]
+                    upload_input, sel = find_first("upload_input", upload_input_selectors, timeout=15)
+                    if upload_input:
+                        logger.info(f"📤 Найден input для загрузки: {sel}")
+
+                    if not upload_input:
+                        logger.error("❌ Не найден input для загрузки файла")
+                        take_screenshot("no_upload_input")
+                        return
+
+                    on_state('uploading')
+                    with tracer.span("upload", group=group_url, file_size=file_size) as span:
+                        ids_before = form_video_ids() if UPLOAD_ONCE else []
+                        upload_input.send_keys(video_file)
+                        monitor = UploadMonitor(file_size)
+                        logger.info(f"⏳ Жду активации кнопки Share (до {monitor.deadline - monitor.started:.0f} сек, "
+                                    f"продлевается по прогрессу)...")
+
+                        upload_success = False
+                        next_report = time.time() + 15
+                        while not monitor.expired():
+                            state = wait_for_dom(UPLOAD_STATE_JS, 5)
+                            if state and state['error'] is not None:
+                                logger.error(f"❌ Ошибка загрузки: {state['error']}")
                                 take_screenshot("upload_error")
+                                span['error'] = state['error']
                                 return
-
-                        if i % 15 == 0 and i > 0:
-                            logger.info(f"⏳ Ожидание активации кнопки Share... ({i}/{wait_time} сек)")
-
-                        time.sleep(1)
-                    except Exception as e:
-                        logger.warning(f"⚠️ Ошибка при проверке кнопки Share: {e}")
-                        time.sleep(1)
-                        continue
-
-                if not upload_success:
-                    logger.error("❌ Кнопка Share не активировалась - загрузка видео не завершена")
-                    take_screenshot("share_button_not_activated")
-                    return
+                            if state:
+                                upload_success = True
+                                logger.info("✅ Кнопка Share активирована - видео загружено!")
+                                monitor.save_speed()
+                                break
+
+                            monitor.update(probe_posting_state()['progress'])
+                            if monitor.stalled():
+                                logger.error(f"❌ Загрузка зависла на {monitor.last_progress:.0f}% "
+                                             f"(нет прогресса {UPLOAD_STALL_TIMEOUT} сек)")
+                                take_screenshot("upload_stalled")
+                                span['error'] = "загрузка зависла"
+                                return
+                            if time.time() >= next_report:
+                                next_report += 15
+                                elapsed = time.time() - monitor.started
+                                if monitor.last_progress is None:
+                                    logger.info(f"⏳ Ожидание активации кнопки Share... ({elapsed:.0f} сек)")
+                                else:
+                                    speed = monitor.speed() or 0
+                                    logger.info(f"⏳ Загружено {monitor.last_progress:.0f}%, {speed / 1024:.0f} КБ/с, "
+                                                f"осталось ~{monitor.eta():.0f} сек ({elapsed:.0f} сек)")
+
+                        if not upload_success:
+                            span['error'] = "Share не активировалась"
+
+                    if not upload_success:
+                        logger.error("❌ Кнопка Share не активировалась - загрузка видео не завершена")
+                        take_screenshot("share_button_not_activated")
+                        return
+
+                    if UPLOAD_ONCE:
+                        video_id = get_uploaded_video_id(ids_before)
+                        if video_id:
+                            uploaded_videos[video_file] = video_id
+                            logger.info(f"💾 Запомнил id видео для следующих групп: {video_id}")
 
             except Exception as e:
                 logger.error(f"❌ Ошибка загрузки видеофайла: {e}")
@@ -511,16 +1721,8 @@ def post_to_group(group_url, video_file=None, video_url=None, text=""):
             box.send_keys(Keys.SPACE)
             logger.info("✍️ Ссылка на видео вставлена")
             logger.info("⏳ Жду активации кнопки Share для ссылки на видео...")
-            for i in range(15):
-                try:
-                    share_button = driver.find_element(By.CSS_SELECTOR, "button.js-pf-submit-btn[data-action='submit']")
-                    if share_button.get_attribute("disabled") is None:
-                        logger.info("✅ Кнопка Share активирована - ссылка обработана!")
-                        break
-                    time.sleep(1)
-                except:
-                    time.sleep(1)
-                    continue
+            if wait_for_share_enabled(15):
+                logger.info("✅ Кнопка Share активирована - ссылка обработана!")
             else:
                 logger.warning("⚠️ Кнопка Share не активировалась для ссылки")
                 take_screenshot("link_not_processed")
@@ -537,17 +1739,23 @@ def post_to_group(group_url, video_file=None, video_url=None, text=""):
 
         # Публикуем
         try:
-            share_button = driver.find_element(By.CSS_SELECTOR, "button.js-pf-submit-btn[data-action='submit']")
-            if share_button.get_attribute("disabled") is not None:
+            if probe_posting_state()['share_disabled'] is not False:
                 logger.error("❌ Кнопка Share неактивна - не могу опубликовать")
                 take_screenshot("share_button_disabled_before_publish")
                 return
 
-            share_button.click()
+            share_button = driver.find_element(By.CSS_SELECTOR, "button.js-pf-submit-btn[data-action='submit']")
+            read_network_events()  # дальше нужны только запросы, вызванные публикацией
+            on_state('publishing')
+            with tracer.span("publish", group=group_url):
+                share_button.click()
             logger.info("✅ Опубликовано")
 
             # Ищем ссылку на опубликованный пост и отправляем в Telegram
-            post_link = wait_for_post_link(timeout=30)
+            with tracer.span("wait_post_link", group=group_url) as span:
+                post_link = wait_for_post_link(timeout=30, group_url=group_url)
+                if not post_link:
+                    span['error'] = "ссылка не найдена"
             if post_link:
                 logger.info(f"✅ Получена ссылка на пост: {post_link}")
                 return post_link  # Возвращаем ссылку вместо отправки в Telegram
@@ -565,63 +1773,1020 @@ def post_to_group(group_url, video_file=None, video_url=None, text=""):
         logger.error(f"❌ Общая ошибка постинга в группу {group_url}: {e}")
         take_screenshot("post_general_error")
 
+# Журнал запуска: состояние каждой группы (pending, uploading, publishing,
+# published, failed) сохраняется на диск по мере постинга. После падения или
+# таймаута команда #продолжить запускает прерванный пост заново: опубликованные
+# группы пропускаются, неудачные повторяются с нарастающей паузой. Группы, где
+# Share уже нажата, но ссылка не получена, не повторяются, чтобы не создать дубль.
+JOURNAL_FILE = os.getenv("JOURNAL_FILE", os.path.expanduser("~/.okru_bot/journal.json"))
+RESUME_RUN = os.getenv("RESUME_RUN", "1") == "1"
+RESUME_MAX_ATTEMPTS = int(os.getenv("RESUME_MAX_ATTEMPTS", "3"))
+RESUME_BACKOFF = int(os.getenv("RESUME_BACKOFF", "30"))  # сек, удваивается с каждой попыткой
+
+class RunJournal:
+    def __init__(self, path, max_attempts, backoff):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self._lock = threading.Lock()
+        self.data = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def fingerprint(groups, video_file, video_url, text):
+        video_hash = None
+        if video_file and os.path.exists(video_file):
+            video_hash = video_cache.sha256_of(video_file)
+            if not video_hash:
+                # Файл не из кэша (например, с локального сервера Bot API) — считаем хэш сами
+                digest = hashlib.sha256()
+                with open(video_file, 'rb') as f:
+                    for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+                        digest.update(chunk)
+                video_hash = digest.hexdigest()
+        raw = json.dumps([sorted(groups), video_hash, video_url, text], ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _retryable(self, entry):
+        return entry['state'] in ('pending', 'uploading') or (
+            entry['state'] == 'failed' and entry['attempts'] < self.max_attempts)
+
+    def reopen(self):
+        # По команде #продолжить: последний запуск, где остались группы для повтора
+        params = self.data.get('params')
+        if not params or not any(self._retryable(e) for e in self.data['groups'].values()):
+            return None
+        if params['video_file'] and not os.path.exists(params['video_file']):
+            return None
+        with self._lock:
+            self.data['finished'] = None
+            self._save()
+        return params['groups'], params['video_file'], params['video_url'], params['text']
+
+    def begin(self, groups, video_file, video_url, text):
+        key = self.fingerprint(groups, video_file, video_url, text)
+        with self._lock:
+            # Журнал завершённого запуска не переиспользуем: тот же пост можно опубликовать повторно
+            if self.data.get('key') != key or self.data.get('finished'):
+                self.data = {
+                    'key': key,
+                    'started': time.time(),
+                    'finished': None,
+                    'params': {'groups': groups, 'video_file': video_file, 'video_url': video_url, 'text': text},
+                    'groups': {url: {'state': 'pending', 'attempts': 0, 'link': None, 'error': None, 'updated': None}
+                               for url in groups}
+                }
+            else:
+                logger.info("♻️ Найден журнал прерванного запуска с теми же параметрами")
+                # Процесс упал между нажатием Share и получением ссылки: пост мог выйти
+                for entry in self.data['groups'].values():
+                    if entry['state'] == 'publishing':
+                        entry.update(state='unconfirmed', error="Share нажата, ссылка не получена",
+                                     updated=time.time())
+            self._save()
+        todo, skipped = [], []
+        for url in groups:
+            entry = self.data['groups'][url]
+            if self._retryable(entry):
+                todo.append(url)
+            else:
+                skipped.append({'group': url, 'link': entry['link'], 'error': entry['error'], 'duration': 0})
+                if entry['state'] == 'published':
+                    logger.info(f"⏭️ Уже опубликовано: {url}")
+                else:
+                    logger.warning(f"⏭️ Пропускаю {url}: {entry['state']}, {entry['error']}")
+        return todo, skipped
+
+    def complete(self):
+        with self._lock:
+            self.data['finished'] = time.time()
+            self._save()
+
+    def set(self, url, state, **fields):
+        with self._lock:
+            entry = self.data['groups'][url]
+            entry.update(fields, state=state, updated=time.time())
+            self._save()
+
+    def finish(self, result):
+        url = result['group']
+        with self._lock:
+            state = self.data['groups'][url]['state']
+        if result['link']:
+            self.set(url, 'published', link=result['link'], error=None)
+        elif state == 'publishing':
+            # Share нажата, а ссылки нет: пост мог выйти, повтор создал бы дубль
+            self.set(url, 'unconfirmed', error=result['error'])
+        else:
+            self.set(url, 'failed', error=result['error'], attempts=self.data['groups'][url]['attempts'] + 1)
+
+    def delay(self, url):
+        entry = self.data['groups'][url]
+        if entry['state'] != 'failed' or not entry['attempts']:
+            return 0
+        due = entry['updated'] + self.backoff * 2 ** (entry['attempts'] - 1)
+        return max(0, due - time.time())
+
+journal = RunJournal(JOURNAL_FILE, RESUME_MAX_ATTEMPTS, RESUME_BACKOFF)
+
+# Параллельный постинг: до POST_CONCURRENCY групп одновременно,
+# каждая в своём Chrome с cookies основной сессии
+POST_CONCURRENCY = int(os.getenv("POST_CONCURRENCY", "1"))
+POST_MIN_INTERVAL = float(os.getenv("POST_MIN_INTERVAL", "3"))  # сек между началом публикаций
+
+class RateLimiter:
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.time()
+            delay = max(0.0, self._next - now)
+            self._next = max(now, self._next) + self.min_interval
+        if delay:
+            time.sleep(delay)
+
+def clone_driver(cookies):
+    with tracer.span("init_driver", clone=True):
+        instance = init_driver()
+    instance.get(OK_BASE_URL + "/")
+    for cookie in cookies:
+        try:
+            instance.add_cookie(cookie)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось перенести cookie {cookie.get('name')}: {e}")
+    return instance
+
+# Контроль памяти Chrome: RSS процессов браузера и chromedriver замеряется во
+# время каждой группы (пик пишется в лог и в span). Между группами при росте
+# памяти чистим страницу и кэш, а при превышении лимита или после
+# BROWSER_RECYCLE_POSTS постов перезапускаем Chrome с cookies текущей сессии.
+BROWSER_MAX_RSS_MB = int(os.getenv("BROWSER_MAX_RSS_MB", "3072"))
+BROWSER_RECYCLE_POSTS = int(os.getenv("BROWSER_RECYCLE_POSTS", "25"))  # 0 — не перезапускать по счётчику
+BROWSER_RSS_SAMPLE_INTERVAL = float(os.getenv("BROWSER_RSS_SAMPLE_INTERVAL", "2"))
+OK_HOSTNAME = urlparse(OK_BASE_URL).hostname
+
+def process_tree_rss(root_pids):
+    # Суммарный RSS процессов и всех их потомков по /proc (только Linux)
+    if not hasattr(os, 'sysconf') or not os.path.isdir('/proc'):
+        return None
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    children = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat') as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(name))
+    total = 0
+    seen = set()
+    stack = list(root_pids)
+    while stack:
+        pid = stack.pop()
+        if pid in seen:
+            continue
+        seen.add(pid)
+        try:
+            with open(f'/proc/{pid}/statm') as f:
+                total += int(f.read().split()[1]) * page_size
+        except (OSError, ValueError, IndexError):
+            continue
+        stack.extend(children.get(pid, []))
+    return total
+
+def browser_pids(instance):
+    process = getattr(getattr(instance, 'service', None), 'process', None)
+    return [pid for pid in (getattr(instance, 'browser_pid', None), getattr(process, 'pid', None)) if pid]
+
+def export_cookies(instance):
+    # Через CDP cookies доступны с любой страницы, а не только с текущего домена
+    cookies = []
+    for c in instance.execute_cdp_cmd("Network.getAllCookies", {})['cookies']:
+        if not OK_HOSTNAME.endswith(c['domain'].lstrip('.')):
+            continue
+        cookie = {k: c[k] for k in ('name', 'value', 'domain', 'path', 'secure', 'httpOnly')}
+        if c.get('expires', -1) > 0:
+            cookie['expiry'] = int(c['expires'])
+        cookies.append(cookie)
+    return cookies
+
+class BrowserSupervisor:
+    def __init__(self, max_rss, recycle_posts, interval):
+        self.max_rss = max_rss
+        self.recycle_posts = recycle_posts
+        self.interval = interval
+        self.peak = 0
+        self._posts = {}
+        self._lock = threading.Lock()
+
+    def rss(self, instance):
+        return process_tree_rss(browser_pids(instance))
+
+    @contextmanager
+    def track(self, instance, span):
+        peak = [self.rss(instance) or 0]
+        stop = threading.Event()
+
+        def sample():
+            while not stop.wait(self.interval):
+                value = self.rss(instance)
+                if value:
+                    peak[0] = max(peak[0], value)
+
+        sampler = threading.Thread(target=sample, name="rss-sampler", daemon=True)
+        sampler.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            sampler.join()
+            if peak[0]:
+                with self._lock:
+                    self.peak = max(self.peak, peak[0])
+                span['rss_peak_mb'] = peak[0] // (1024 * 1024)
+                logger.info(f"🧠 Пик памяти Chrome: {span['rss_peak_mb']} МБ")
+
+    def trim(self, instance):
+        instance.get("about:blank")
+        instance.execute_cdp_cmd("Network.clearBrowserCache", {})
+        instance.execute_cdp_cmd("Storage.clearDataForOrigin", {
+            "origin": OK_BASE_URL,
+            "storageTypes": "cache_storage,service_workers,shader_cache"
+        })
+
+    def check(self, instance):
+        # Вызывается между группами; возвращает драйвер для следующей группы
+        with self._lock:
+            posts = self._posts[instance] = self._posts.get(instance, 0) + 1
+        reason = None
+        if self.recycle_posts and posts >= self.recycle_posts:
+            reason = f"{posts} постов"
+        else:
+            rss = self.rss(instance)
+            if rss and rss > self.max_rss * 0.75:
+                try:
+                    self.trim(instance)
+                except Exception as e:
+                    logger.warning(f"⚠️ Не удалось очистить кэш Chrome: {e}")
+                trimmed = self.rss(instance) or 0
+                logger.info(f"🧹 Память Chrome после очистки: {rss // 1048576} → {trimmed // 1048576} МБ")
+                if trimmed > self.max_rss:
+                    reason = f"память {trimmed // 1048576} МБ"
+        if not reason:
+            return instance
+
+        try:
+            cookies = export_cookies(instance)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось выгрузить cookies, Chrome не перезапускаю: {e}")
+            return instance
+        logger.info(f"♻️ Перезапускаю Chrome ({reason})")
+        with tracer.span("recycle_driver", reason=reason):
+            with self._lock:
+                self._posts.pop(instance, None)
+            try:
+                instance.quit()
+            except Exception:
+                pass
+            return clone_driver(cookies)
+
+supervisor = BrowserSupervisor(BROWSER_MAX_RSS_MB * 1024 * 1024, BROWSER_RECYCLE_POSTS, BROWSER_RSS_SAMPLE_INTERVAL)
+
+def post_to_groups(groups, video_file=None, video_url=None, text="", concurrency=POST_CONCURRENCY,
+                   on_result=None, journal=None):
+    results = [None] * len(groups)
+    limiter = RateLimiter(POST_MIN_INTERVAL)
+
+    def run(i, group_url):
+        on_state = None
+        if journal:
+            delay = journal.delay(group_url)
+            if delay:
+                logger.info(f"⏳ Повтор {group_url} через {delay:.0f} сек")
+                time.sleep(delay)
+            journal.set(group_url, 'pending')
+            on_state = lambda state: journal.set(group_url, state)
+        limiter.wait()
+        logger.info(f"📝 Публикую в группу {i + 1}/{len(groups)}: {group_url}")
+        started = time.time()
+        with tracer.span("post_to_group", group=group_url) as span, supervisor.track(driver.current(), span):
+            try:
+                post_link = post_to_group(group_url, video_file, video_url, text, on_state=on_state)
+                error = None if post_link else "ссылка на пост не получена"
+            except Exception as e:
+                post_link, error = None, str(e)
+            span.update(link=post_link, error=error)
+        results[i] = {
+            'group': group_url,
+            'link': post_link,
+            'error': error,
+            'duration': round(time.time() - started, 1)
+        }
+        if journal:
+            journal.finish(results[i])
+        if on_result:
+            on_result(results[i])
+
+    pending = list(enumerate(groups))
+    # Первое видео загружаем в одиночку, чтобы остальные группы взяли его из «Мои видео»
+    if pending and video_file and UPLOAD_ONCE and concurrency > 1:
+        run(*pending.pop(0))
+        driver.default = supervisor.check(driver.default)
+
+    workers = min(concurrency, len(pending))
+    if workers <= 1:
+        for n, item in enumerate(pending):
+            run(*item)
+            if n + 1 < len(pending):
+                driver.default = supervisor.check(driver.default)
+        return results
+
+    cookies = driver.default.get_cookies()
+    drivers = [driver.default]
+    for _ in range(workers - 1):
+        try:
+            drivers.append(clone_driver(cookies))
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось запустить дополнительный Chrome: {e}")
+    logger.info(f"🧵 Публикую параллельно в {len(drivers)} браузерах")
+
+    jobs = queue.Queue()
+    for item in pending:
+        jobs.put(item)
+
+    def worker(n):
+        driver.bind(drivers[n])
+        while True:
+            try:
+                item = jobs.get_nowait()
+            except queue.Empty:
+                return
+            run(*item)
+            if not jobs.empty():
+                drivers[n] = supervisor.check(drivers[n])
+                driver.bind(drivers[n])
+                if n == 0:
+                    driver.default = drivers[0]
+
+    threads = [threading.Thread(target=worker, args=(n,), name=f"poster-{n}") for n in range(len(drivers))]
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        for instance in drivers[1:]:
+            try:
+                instance.quit()
+            except Exception:
+                pass
+    return results
+
+# Запуск Chrome и вход в ok.ru
+def start_browser():
+    started = time.time()
+    with tracer.span("init_driver"):
+        driver.default = init_driver()
+    with tracer.span("login"):
+        login()
+    logger.info(f"🎉 Вход выполнен ({time.time() - started:.0f} сек)")
+
+# Приём команд #группы и #пост (вместе со скачиванием видео) в фоновом потоке,
+# или #продолжить для прерванного запуска из журнала
+def match_resume(msg):
+    return True if re.match(r"#продолжить\b", msg.get('text', '').strip(), re.IGNORECASE) else None
+
+def match_intake(msg):
+    if RESUME_RUN and match_resume(msg):
+        return 'resume', None
+    urls = match_groups(msg)
+    return ('groups', urls) if urls else None
+
+def start_intake():
+    intake = Future()
+
+    def run():
+        try:
+            logger.info("⏳ Жду команду #группы" + (" или #продолжить" if RESUME_RUN else ""))
+            while True:
+                kind, groups = updates.wait_for(match_intake)
+                if kind == 'groups':
+                    logger.info("✅ Группы получены")
+                    intake.set_result((groups,) + retrieve_post_info())
+                    return
+                resumed = journal.reopen()
+                if resumed:
+                    logger.info("♻️ Продолжаю прерванный запуск из журнала")
+                    intake.set_result(resumed)
+                    return
+                logger.warning("⚠️ Нет прерванного запуска для продолжения, жду #группы")
+        except Exception as e:
+            intake.set_exception(e)
+
+    threading.Thread(target=run, name="intake", daemon=True).start()
+    return intake
+
+# Несколько аккаунтов: по процессу Chrome на аккаунт со своей сессией и журналом.
+# Координатор делит группы между аккаунтами: группа достаётся аккаунту, который
+# уже публиковал в неё (состоит в группе), а при равенстве — наименее загруженному
+# по прошлой длительности постинга. Результаты сводятся в один отчёт.
+SHARD_STATS_FILE = os.getenv("SHARD_STATS_FILE", os.path.expanduser("~/.okru_bot/shard_stats.json"))
+SHARD_READY_TIMEOUT = int(os.getenv("SHARD_READY_TIMEOUT", "600"))  # сек на запуск Chrome и вход
+SHARD_DEFAULT_DURATION = 60.0  # сек на группу, пока нет статистики
+
+shard_channel = None  # связь с координатором в процессе аккаунта
+
+def account_path(path, email):
+    root, ext = os.path.splitext(path)
+    return f"{root}_{hashlib.sha1(email.encode()).hexdigest()[:8]}{ext}"
+
+def plan_shards(groups, accounts, stats):
+    known = sorted(entry['duration'] for entry in stats.values() if entry.get('duration'))
+    default = known[len(known) // 2] if known else SHARD_DEFAULT_DURATION
+    cost = {url: stats.get(url, {}).get('duration') or default for url in groups}
+    loads = [0.0] * len(accounts)
+    shards = [[] for _ in accounts]
+    # Сначала раскладываем самые долгие группы, чтобы загрузка вышла ровнее
+    for url in sorted(groups, key=lambda u: -cost[u]):
+        entry = stats.get(url, {})
+        members = [i for i, acc in enumerate(accounts) if acc['email'] in entry.get('members', [])]
+        allowed = [i for i, acc in enumerate(accounts) if acc['email'] not in entry.get('failed', [])]
+        candidates = members or allowed or list(range(len(accounts)))
+        i = min(candidates, key=lambda n: loads[n])
+        shards[i].append(url)
+        loads[i] += cost[url]
+    # Внутри доли сохраняем порядок из команды #группы
+    order = {url: n for n, url in enumerate(groups)}
+    return [sorted(shard, key=order.get) for shard in shards], loads
+
+class ShardChannel:
+    # Со стороны процесса аккаунта: заменяет журнал и ожидание SMS
+    def __init__(self, index, events, replies, delays=None):
+        self.index = index
+        self.events = events
+        self.replies = replies
+        self.delays = delays or {}
+
+    def request_sms(self, timeout):
+        self.events.put(('sms', self.index, timeout))
+        try:
+            code = self.replies.get(timeout=timeout + 30)
+        except queue.Empty:
+            code = None
+        if not code:
+            raise TimeoutException("SMS-код не получен")
+        return code
+
+    def delay(self, url):
+        return self.delays.get(url, 0)
+
+    def set(self, url, state):
+        self.events.put(('state', self.index, url, state))
+
+    def finish(self, result):
+        self.events.put(('result', self.index, result))
+
+def shard_worker(index, account, events, replies):
+    global EMAIL, PASSWORD, SESSION_FILE, shard_channel
+    EMAIL, PASSWORD = account['email'], account['password']
+    SESSION_FILE = account_path(SESSION_FILE, EMAIL)
+    shard_channel = ShardChannel(index, events, replies)
+    label = EMAIL.split('@')[0]
+    for handler in logger.handlers:
+        handler.setFormatter(logging.Formatter(f"%(asctime)s | %(levelname)s | [{label}] %(message)s"))
+    try:
+        start_browser()
+        events.put(('ready', index))
+        job = replies.get()
+        if job:
+            shard_channel.delays = job['delays']
+            post_to_groups(job['groups'], job['video_file'], job['video_url'], job['text'], journal=shard_channel)
+    except Exception as e:
+        logger.error(f"🔥 Ошибка процесса аккаунта: {e}")
+        events.put(('error', index, str(e)))
+    finally:
+        artifacts.flush()
+        tracer.export(account_path(TRACE_FILE, EMAIL), account_path(METRICS_FILE, EMAIL))
+        if driver.default:
+            driver.quit()
+        events.put(('done', index))
+        logger.removeHandler(tg)
+        tg.close()
+
+class ShardCoordinator:
+    def __init__(self, accounts, stats_path):
+        self.accounts = accounts
+        self.stats_path = stats_path
+        self.ctx = multiprocessing.get_context('spawn')
+        self.events = self.ctx.Queue()
+        self.workers = []
+        self._sms_lock = threading.Lock()
+        # События процессов разбирает фоновый поток с момента запуска: SMS-коды и
+        # готовность обрабатываются, пока основной поток ждёт команды из Telegram
+        self._changed = threading.Condition()
+        self._results = queue.Queue()
+        self._stopping = threading.Event()
+        self._pump = None
+
+    def _load_stats(self):
+        try:
+            with open(self.stats_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_stats(self, stats):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.stats_path)), exist_ok=True)
+            tmp_path = self.stats_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(stats, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.stats_path)
+        except OSError as e:
+            logger.warning(f"⚠️ Не удалось сохранить статистику аккаунтов: {e}")
+
+    def start(self):
+        # Драйвер патчим один раз заранее, чтобы процессы не делали это одновременно
+        version_main = detect_chrome_major()
+        if not version_main or not os.path.exists(cached_driver_path(version_main)):
+            with tracer.span("init_driver", provision=True):
+                init_driver().quit()
+        for index, account in enumerate(self.accounts):
+            replies = self.ctx.Queue()
+            process = self.ctx.Process(target=shard_worker, args=(index, account, self.events, replies),
+                                       name=f"shard-{index}")
+            process.start()
+            self.workers.append({'account': account, 'process': process, 'replies': replies,
+                                 'state': 'starting', 'groups': []})
+        logger.info(f"👥 Запущено процессов аккаунтов: {len(self.workers)}")
+        self._pump = threading.Thread(target=self._pump_events, name="shard-events", daemon=True)
+        self._pump.start()
+
+    def _answer_sms(self, index, timeout):
+        worker = self.workers[index]
+        # Коды запрашиваются по одному: ожидание регистрируется после подсказки
+        # и принимает только сообщения, отправленные после неё
+        with self._sms_lock:
+            logger.info(f"📱 Пришлите SMS-код для {worker['account']['email']}")
+            try:
+                code = updates.wait_for(match_sms_code, timeout=timeout, edits=True,
+                                        since=time.time() - SMS_CLOCK_SKEW)
+            except TimeoutException:
+                code = None
+        worker['replies'].put(code)
+
+    def _set_state(self, worker, state):
+        with self._changed:
+            worker['state'] = state
+            self._changed.notify_all()
+
+    def _pump_events(self):
+        # Результаты и состояния групп передаются в run(), остальное обрабатывается здесь;
+        # умершие процессы помечаются завершёнными
+        while not self._stopping.is_set():
+            try:
+                event = self.events.get(timeout=1)
+            except queue.Empty:
+                for worker in self.workers:
+                    if worker['state'] not in ('done', 'failed') and not worker['process'].is_alive():
+                        self._set_state(worker, 'failed')
+                continue
+            except (EOFError, OSError):
+                return
+            kind, index = event[0], event[1]
+            worker = self.workers[index]
+            if kind == 'sms':
+                threading.Thread(target=self._answer_sms, args=(index, event[2]), daemon=True).start()
+            elif kind == 'ready':
+                self._set_state(worker, 'ready')
+            elif kind == 'error':
+                logger.error(f"❌ Аккаунт {worker['account']['email']}: {event[2]}")
+                if worker['state'] == 'starting':
+                    self._set_state(worker, 'failed')
+            elif kind == 'done':
+                if worker['state'] != 'done':
+                    self._set_state(worker, 'done' if worker['state'] == 'running' else 'failed')
+            else:
+                self._results.put((worker, event))
+
+    def _events(self):
+        # Результаты групп, пока хоть один процесс публикует; после — остаток очереди
+        while True:
+            try:
+                yield self._results.get(timeout=1)
+            except queue.Empty:
+                if all(w['state'] != 'running' for w in self.workers) and self._results.empty():
+                    return
+
+    def run(self, groups, video_file=None, video_url=None, text="", on_result=None, journal=None):
+        with self._changed:
+            self._changed.wait_for(lambda: all(w['state'] != 'starting' for w in self.workers),
+                                   timeout=SHARD_READY_TIMEOUT)
+        ready = [w for w in self.workers if w['state'] == 'ready']
+        if not ready:
+            raise Exception("Ни один аккаунт не смог войти")
+
+        stats = self._load_stats()
+        shards, loads = plan_shards(groups, [w['account'] for w in ready], stats)
+        for worker, shard, load in zip(ready, shards, loads):
+            worker['groups'] = shard
+            self._set_state(worker, 'running' if shard else 'done')
+            worker['replies'].put({
+                'groups': shard, 'video_file': video_file, 'video_url': video_url, 'text': text,
+                'delays': {url: journal.delay(url) for url in shard} if journal else {}
+            } if shard else None)
+            logger.info(f"👥 {worker['account']['email']}: групп {len(shard)}, ~{load:.0f} сек")
+
+        results = {}
+        for worker, event in self._events():
+            if event[0] == 'state':
+                if journal:
+                    journal.set(event[2], event[3])
+                continue
+            result = event[2]
+            results[result['group']] = result
+            self._record(stats, worker['account']['email'], result)
+            if journal:
+                journal.finish(result)
+            if on_result:
+                on_result(result)
+
+        # Группы процессов, завершившихся раньше времени
+        for worker in ready:
+            for url in worker['groups']:
+                if url not in results:
+                    results[url] = {'group': url, 'link': None, 'duration': 0,
+                                    'error': f"процесс аккаунта {worker['account']['email']} завершился"}
+                    if journal:
+                        journal.finish(results[url])
+                    if on_result:
+                        on_result(results[url])
+        self._save_stats(stats)
+        return [results[url] for url in groups]
+
+    @staticmethod
+    def _record(stats, email, result):
+        entry = stats.setdefault(result['group'], {'duration': None, 'members': [], 'failed': []})
+        if result['link']:
+            prev = entry['duration']
+            entry['duration'] = result['duration'] if prev is None else round(0.7 * prev + 0.3 * result['duration'], 1)
+            if email not in entry['members']:
+                entry['members'].append(email)
+            if email in entry['failed']:
+                entry['failed'].remove(email)
+        elif email not in entry['members'] and email not in entry['failed']:
+            entry['failed'].append(email)
+
+    def stop(self):
+        for worker in self.workers:
+            if worker['process'].is_alive() and worker['state'] in ('starting', 'ready'):
+                worker['replies'].put(None)
+        for worker in self.workers:
+            worker['process'].join(timeout=60)
+            if worker['process'].is_alive():
+                worker['process'].terminate()
+        self._stopping.set()
+        if self._pump:
+            self._pump.join(timeout=5)
+
+# Публикация одного поста во все группы с отчётом в Telegram
+def run_post_job(groups, video_file, video_url, post_text, journal=None, coordinator=None):
+    skipped = []
+    if journal:
+        groups, skipped = journal.begin(groups, video_file, video_url, post_text)
+    # Ссылки уходят в Telegram по мере публикации
+    reporter = ResultReporter(bot_api, TELEGRAM_USER_ID, len(groups) + len(skipped))
+    try:
+        for r in skipped:
+            reporter.report(r)
+        run = coordinator.run if coordinator else post_to_groups
+        results = skipped + run(groups, video_file, video_url, post_text,
+                                on_result=reporter.report, journal=journal)
+        if journal:
+            journal.complete()
+    finally:
+        reporter.close()
+    for r in results:
+        if r['error']:
+            logger.warning(f"⚠️ {r['group']}: {r['error']} ({r['duration']} сек)")
+    if not any(r['link'] for r in results):
+        logger.warning("⚠️ Нет ссылок для отправки")
+    return results
+
+# Удаляем временный файл, если он был создан и не лежит в кэше
+def cleanup_video(video_file):
+    if video_file in external_files:
+        return
+    if video_file and os.path.exists(video_file) and not video_cache.contains_path(video_file):
+        try:
+            os.unlink(video_file)
+            logger.info("🗑️ Временный файл удален")
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось удалить временный файл: {e}")
+
+def log_selector_stats():
+    for name, st in selector_registry.stats().items():
+        logger.info(f"📊 Селектор {name}: попаданий {st['hits']}, промахов {st['misses']}, "
+                    f"неудач {st['failures']}, последний {st['last']}")
+
+# Режим демона: один прогретый браузер с активной сессией и очередь заданий
+# в SQLite. Команды #группы + #пост из Telegram превращаются в задания, которые
+# выполняются по приоритету («#пост !» или «#пост !5») с ограничением частоты
+# публикаций в одну и ту же группу. Очередь переживает перезапуск процесса.
+DAEMON_MODE = os.getenv("DAEMON_MODE", "0") == "1"
+JOB_DB_FILE = os.getenv("JOB_DB_FILE", os.path.expanduser("~/.okru_bot/jobs.db"))
+GROUP_MIN_INTERVAL = int(os.getenv("GROUP_MIN_INTERVAL", "300"))  # сек между постами в одну группу
+PRIORITY_RE = re.compile(r"^!(\d*)\s*")
+
+class JobQueue:
+    def __init__(self, path, group_interval):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.group_interval = group_interval
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._ready = threading.Condition()
+        with self._ready:
+            self.db.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    groups TEXT NOT NULL,
+                    video_file TEXT,
+                    video_url TEXT,
+                    text TEXT NOT NULL DEFAULT '',
+                    results TEXT NOT NULL DEFAULT '[]',
+                    created REAL NOT NULL,
+                    not_before REAL NOT NULL DEFAULT 0,
+                    started REAL,
+                    finished REAL
+                );
+                CREATE TABLE IF NOT EXISTS group_posts (
+                    url TEXT PRIMARY KEY,
+                    posted REAL NOT NULL
+                );
+            """)
+            # Задания, прерванные падением процесса, возвращаются в очередь
+            self.db.execute("UPDATE jobs SET status = 'pending' WHERE status = 'running'")
+
+    def put(self, groups, video_file=None, video_url=None, text="", priority=0):
+        with self._ready:
+            cur = self.db.execute(
+                "INSERT INTO jobs (priority, groups, video_file, video_url, text, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (priority, json.dumps(groups), video_file, video_url, text, time.time())
+            )
+            self._ready.notify()
+            return cur.lastrowid
+
+    def take(self, timeout=None):
+        deadline = time.time() + timeout if timeout is not None else None
+        with self._ready:
+            while True:
+                now = time.time()
+                row = self.db.execute(
+                    "SELECT id, priority, groups, video_file, video_url, text, results, created, started "
+                    "FROM jobs WHERE status = 'pending' AND not_before <= ? "
+                    "ORDER BY priority DESC, id LIMIT 1", (now,)
+                ).fetchone()
+                if row:
+                    started = row[8] or now
+                    self.db.execute("UPDATE jobs SET status = 'running', started = ? WHERE id = ?", (started, row[0]))
+                    return {
+                        'id': row[0], 'priority': row[1], 'groups': json.loads(row[2]),
+                        'video_file': row[3], 'video_url': row[4], 'text': row[5],
+                        'results': json.loads(row[6]), 'created': row[7], 'started': started
+                    }
+                # Спим до ближайшего отложенного задания, нового задания или таймаута
+                wake = self.db.execute("SELECT MIN(not_before) FROM jobs WHERE status = 'pending'").fetchone()[0]
+                wait_until = min(t for t in (wake, deadline) if t is not None) if (wake or deadline) else None
+                if deadline is not None and now >= deadline:
+                    return None
+                self._ready.wait(None if wait_until is None else max(0.1, wait_until - now))
+
+    def split_ready(self, groups):
+        # Группы, в которые недавно публиковали, откладываются до конца интервала
+        now = time.time()
+        ready, deferred, not_before = [], [], None
+        with self._ready:
+            for url in groups:
+                row = self.db.execute("SELECT posted FROM group_posts WHERE url = ?", (url,)).fetchone()
+                available = row[0] + self.group_interval if row else 0
+                if available <= now:
+                    ready.append(url)
+                else:
+                    deferred.append(url)
+                    not_before = available if not_before is None else min(not_before, available)
+        return ready, deferred, not_before
+
+    def mark_posted(self, url):
+        with self._ready:
+            self.db.execute("INSERT OR REPLACE INTO group_posts (url, posted) VALUES (?, ?)", (url, time.time()))
+
+    def defer(self, job, groups, not_before, results):
+        with self._ready:
+            self.db.execute(
+                "UPDATE jobs SET status = 'pending', groups = ?, results = ?, not_before = ? WHERE id = ?",
+                (json.dumps(groups), json.dumps(results), not_before, job['id'])
+            )
+            self._ready.notify()
+
+    def finish(self, job, results):
+        status = 'done' if any(r['link'] for r in results) else 'failed'
+        with self._ready:
+            self.db.execute(
+                "UPDATE jobs SET status = ?, groups = '[]', results = ?, finished = ? WHERE id = ?",
+                (status, json.dumps(results), time.time(), job['id'])
+            )
+        return status
+
+    def depth(self):
+        with self._ready:
+            return self.db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'pending'").fetchone()[0]
+
+    def video_files(self):
+        with self._ready:
+            return {row[0] for row in self.db.execute(
+                "SELECT DISTINCT video_file FROM jobs WHERE status IN ('pending', 'running') AND video_file IS NOT NULL"
+            )}
+
+    def uses_file(self, path):
+        with self._ready:
+            return self.db.execute(
+                "SELECT 1 FROM jobs WHERE status IN ('pending', 'running') AND video_file = ? LIMIT 1", (path,)
+            ).fetchone() is not None
+
+    def close(self):
+        with self._ready:
+            self.db.close()
+
+# Приём пар #группы + #пост в очередь заданий
+def start_job_intake(jobs):
+    def run():
+        while True:
+            try:
+                groups = retrieve_groups()
+                video_file, video_url, post_text = retrieve_post_info()
+                m = PRIORITY_RE.match(post_text)
+                priority = (int(m.group(1)) if m.group(1) else 1) if m else 0
+                if m:
+                    post_text = post_text[m.end():]
+                job_id = jobs.put(groups, video_file, video_url, post_text, priority)
+                logger.info(f"📥 Задание #{job_id} принято: групп {len(groups)}, приоритет {priority}, "
+                            f"в очереди {jobs.depth()}")
+            except Exception as e:
+                logger.error(f"❌ Ошибка приёма задания: {e}")
+                time.sleep(5)
+
+    threading.Thread(target=run, name="job-intake", daemon=True).start()
+
+# Перед заданием проверяем, что браузер жив и сессия не истекла
+def ensure_browser():
+    try:
+        driver.default.current_url
+    except Exception as e:
+        logger.warning(f"⚠️ Браузер недоступен ({e}), перезапускаю")
+        try:
+            driver.default.quit()
+        except Exception:
+            pass
+        start_browser()
+        return
+    load_page(OK_BASE_URL + "/", "Главная")
+    if not is_logged_in():
+        logger.info("🔑 Сессия истекла, вхожу заново")
+        with tracer.span("login"):
+            login()
+
+def run_job(jobs, job):
+    waited = job['started'] - job['created']
+    ready, deferred, not_before = jobs.split_ready(job['groups'])
+    logger.info(f"▶️ Задание #{job['id']}: групп {len(ready)}, отложено {len(deferred)}, "
+                f"ожидание в очереди {waited:.0f} сек")
+    with tracer.span("job", job=job['id'], groups=len(ready), deferred=len(deferred)) as span:
+        results = job['results']
+        if ready:
+            ensure_browser()
+            done = run_post_job(ready, job['video_file'], job['video_url'], job['text'])
+            # Браузер демона живёт между заданиями: память и число постов проверяются после каждого
+            if driver.default:
+                driver.default = supervisor.check(driver.default)
+            for r in done:
+                if r['link']:
+                    jobs.mark_posted(r['group'])
+            results = results + done
+        if deferred:
+            jobs.defer(job, deferred, not_before, results)
+            logger.info(f"⏸️ Задание #{job['id']}: {len(deferred)} групп отложено на "
+                        f"{not_before - time.time():.0f} сек")
+            return
+        status = jobs.finish(job, results)
+        span['error'] = None if status == 'done' else "ни одного поста"
+    latency = time.time() - job['created']
+    logger.info(f"🏁 Задание #{job['id']} завершено ({status}): {sum(1 for r in results if r['link'])}/"
+                f"{len(results)} постов, от приёма до конца {latency:.0f} сек, в очереди {jobs.depth()}")
+    if not jobs.uses_file(job['video_file']):
+        cleanup_video(job['video_file'])
+    video_cache.evict()
+    tracer.export(TRACE_FILE, METRICS_FILE, gauges={
+        'queue_depth': ("Заданий в очереди", jobs.depth()),
+        'last_job_wait_seconds': ("Ожидание последнего задания в очереди", f"{waited:.3f}"),
+        'last_job_latency_seconds': ("Время от приёма до завершения последнего задания", f"{latency:.3f}"),
+        'browser_rss_peak_bytes': ("Пик RSS процессов Chrome", supervisor.peak)
+    })
+
+def run_daemon():
+    # SIGTERM завершает процесс так же аккуратно, как Ctrl+C
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    jobs = JobQueue(JOB_DB_FILE, GROUP_MIN_INTERVAL)
+    video_cache.in_use = jobs.video_files  # видео из очереди не вытесняются из кэша
+    try:
+        logger.info(f"🚀 Запуск в режиме демона, в очереди {jobs.depth()}")
+        updates.start()
+        start_browser()
+        start_job_intake(jobs)
+        while True:
+            job = jobs.take(timeout=600)
+            if not job:
+                continue
+            try:
+                run_job(jobs, job)
+            except Exception as e:
+                logger.error(f"🔥 Задание #{job['id']} прервано: {e}")
+                jobs.finish(job, job['results'])
+    except (KeyboardInterrupt, SystemExit):
+        logger.info("🛑 Остановка демона")
+    except Exception as e:
+        logger.error(f"🔥 Ошибка: {e}")
+        sys.exit(1)
+    finally:
+        log_selector_stats()
+        artifacts.flush()
+        tracer.export(TRACE_FILE, METRICS_FILE, gauges={'queue_depth': ("Заданий в очереди", jobs.depth())})
+        video_cache.in_use = lambda: ()
+        jobs.close()
+        updates.stop()
+        if driver.default:
+            driver.quit()
+        logger.info("🔒 Завершено")
+
 # Основной поток
 def main():
+    coordinator = ShardCoordinator(OK_ACCOUNTS, SHARD_STATS_FILE) if len(OK_ACCOUNTS) > 1 else None
     try:
         logger.info("🚀 Начинаю работу")
-        posted_links = []  # Список для хранения всех ссылок на посты
-        driver.get("https://ok.ru/")
-        wait.until(EC.presence_of_element_located((By.NAME,'st.email'))).send_keys(EMAIL)
-        driver.find_element(By.NAME,'st.password').send_keys(PASSWORD)
-        logger.info("🔑 Логин")
-        driver.find_element(By.CSS_SELECTOR, "input[type='submit']").click()
-        time.sleep(2)
-
-        try_confirm_identity()
-        try_sms_verification()
-        logger.info("🎉 Вход выполнен")
-
-        groups = retrieve_groups()
-        video_file, video_url, post_text = retrieve_post_info()
-
-        for i, g in enumerate(groups, 1):
-            logger.info(f"📝 Публикую в группу {i}/{len(groups)}: {g}")
-            post_link = post_to_group(g, video_file, video_url, post_text)  # Получаем ссылку
-            
-            if post_link:
-                posted_links.append(post_link)  # Сохраняем ссылку
-
-            if i < len(groups):
-                time.sleep(3)
-                
-        # Отправляем все ссылки в Telegram после завершения постинга
-        if posted_links:
-            logger.info("📤 Отправляю все ссылки на посты в Telegram")
-            for link in posted_links:
-                send_post_link_to_telegram(link)
-                time.sleep(1)  # Небольшая задержка между отправками
+        updates.start()  # Команды, присланные во время логина, не потеряются
+        intake = start_intake()
+        if coordinator:
+            coordinator.start()  # процессы аккаунтов входят, пока ждём команды
         else:
-            logger.warning("⚠️ Нет ссылок для отправки")
-        
-        # Удаляем временный файл, если он был создан
-        if video_file and os.path.exists(video_file):
-            try:
-                os.unlink(video_file)
-                logger.info("🗑️ Временный файл удален")
-            except Exception as e:
-                logger.warning(f"⚠️ Не удалось удалить временный файл: {e}")
+            start_browser()
+
+        if not intake.done():
+            logger.info("⏳ Браузер готов, жду команды из Telegram")
+        groups, video_file, video_url, post_text = intake.result()
+
+        run_post_job(groups, video_file, video_url, post_text,
+                     journal=journal if RESUME_RUN else None, coordinator=coordinator)
+        cleanup_video(video_file)
 
-        # Очистка кастомной папки
+        # Очистка кастомной папки: всё, кроме кэша видео
         temp_dir = os.getenv('TEMP_VIDEO_DIR', tempfile.gettempdir())
         if temp_dir != tempfile.gettempdir():
             try:
-                import shutil
-                if os.path.exists(temp_dir):
-                    shutil.rmtree(temp_dir)
-                    logger.info("🗑️ Временная папка очищена")
+                cache_dir = os.path.abspath(video_cache.directory)
+                for name in os.listdir(temp_dir):
+                    path = os.path.join(temp_dir, name)
+                    if os.path.abspath(path) == cache_dir:
+                        continue
+                    if os.path.isdir(path):
+                        shutil.rmtree(path)
+                    else:
+                        os.unlink(path)
+                logger.info("🗑️ Временная папка очищена")
             except Exception as e:
                 logger.warning(f"⚠️ Не удалось очистить временную папку: {e}")
 
+        # Кэш видео чистится по лимиту размера
+        video_cache.evict()
+        log_selector_stats()
+
         logger.info("🎉 Все задачи выполнены")
 
     except Exception as e:
@@ -629,8 +2794,21 @@ def main():
         sys.exit(1)
 
     finally:
-        driver.quit()
+        if coordinator:
+            coordinator.stop()
+        artifacts.flush()
+        if ARTIFACT_BUNDLE:
+            artifacts.bundle(ARTIFACT_BUNDLE)
+        tracer.export(TRACE_FILE, METRICS_FILE, gauges={
+            'browser_rss_peak_bytes': ("Пик RSS процессов Chrome за запуск", supervisor.peak)
+        })
+        updates.stop()
+        if driver.default:
+            driver.quit()
         logger.info("🔒 Завершено")
 
 if __name__ == '__main__':
-    main()
+    if DAEMON_MODE:
+        run_daemon()
+    else:
+        main()